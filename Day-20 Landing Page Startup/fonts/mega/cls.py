@@ -1,56 +1,2748 @@
 #!/usr/bin/env python3
 
 import os
+import re
+import pwd
 import sys
+import gzip
+import math
+import operator
+import mmap
+import io
+import zlib
+import stat
+import hashlib
+import tarfile
+import fcntl
 import shutil
 import time
+import heapq
+import queue
+import struct
+import socket
+import ctypes
+import ctypes.util
+import atexit
+import argparse
+import tempfile
 import subprocess
 import threading
 import platform
+import functools
+import http.server
+import concurrent.futures
+import collections
+from array import array
 from datetime import datetime
 
 LOGFILE = "/tmp/python_toolkit.log"
 BACKUP_DIR = "/tmp/python_toolkit_backups"
+BACKUP_CHAIN_DIR = os.path.join(BACKUP_DIR, "incremental")
+BACKUP_REPO_DIR = os.path.join(BACKUP_DIR, "repository")
+BACKUP_IGNORE_FILE = os.path.expanduser("~/.python_toolkit_backup_ignore")
+BACKUP_IGNORE_DEFAULTS = (
+    ".cache/", "node_modules/", "__pycache__/", ".venv/", "venv/", ".tox/", ".local/share/Trash/",
+    ".mozilla/firefox/*/cache2/", ".config/google-chrome/**/Cache/", ".config/chromium/**/Cache/",
+)
+BACKUP_HASH_BLOCK = 1024 * 1024
+BACKUP_CHUNK_SIZE = 4 * 1024 * 1024
+BACKUP_COMPRESS_LEVEL = 6
+BACKUP_WORKERS = os.cpu_count() or 1
+BACKUP_CDC_MIN = 512 * 1024
+BACKUP_CDC_MAX = 4 * 1024 * 1024
+BACKUP_CDC_STEP = 64 * 1024
+BACKUP_CDC_WINDOW = 16
+BACKUP_BATCH_BYTES = 16 * 1024 * 1024
+BACKUP_BATCH_FILES = 256
+BACKUP_PROGRESS_INTERVAL = 1.0
+LOG_QUEUE_SIZE = 10000
+LOG_BATCH_SIZE = 512
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_MAX_AGE = 24 * 60 * 60
+LOG_BACKUP_COUNT = 7
+LOG_TAIL_LINES = 50
+LOG_TAIL_BLOCK = 64 * 1024
+LOG_FOLLOW_LINES = 10
+LOG_FOLLOW_POLL = 1.0
+TOP_PROCESSES = 10
+CGROUP_ROOT = "/sys/fs/cgroup"
+CGROUP_UNLIMITED = 1 << 62
+UTMP_FILE = "/var/run/utmp"
+WTMP_FILE = "/var/log/wtmp"
+UTMP_RECORD = struct.Struct("<hxxi32s4s32s256shhiii16s20x")
+UTMP_USER_PROCESS = 7
+COLLECTOR_TIMEOUT = 2.0
+COLLECTOR_TIMEOUTS = {"disks": 5.0, "processes": 5.0}
+EXPORTER_BIND = "127.0.0.1"
+EXPORTER_PORT = 9105
+EXPORTER_TTL = 5.0
+HISTORY_FILE = "/tmp/python_toolkit_history.bin"
+HISTORY_CAPACITY = 7 * 24 * 60 * 60
+HISTORY_METRICS = ("mem_used_pct", "swap_used_pct", "load1", "load5", "load15", "users")
+HISTORY_HEADER = struct.Struct("<8sIIQQQ")
+HISTORY_HEADER_SIZE = 64
+HISTORY_MAGIC = b"TKHIST01"
+ALERT_RULES_FILE = os.path.expanduser("~/.python_toolkit_alerts")
+ALERT_HYSTERESIS = 0.05
+ANOMALY_ALPHA = 0.05
+ANOMALY_QUANTILE = 0.99
+ANOMALY_Z = 4.0
+ANOMALY_WARMUP = 30
+ANOMALY_MIN_STD = 0.01
+WATCH_INTERVAL = 1.0
+WATCH_SAMPLES = 3600
+CLK_TCK = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+PSEUDO_FILESYSTEMS = {
+    "autofs", "binfmt_misc", "bpf", "cgroup", "cgroup2", "configfs", "debugfs", "devpts",
+    "efivarfs", "fusectl", "hugetlbfs", "mqueue", "nsfs", "proc", "pstore", "rpc_pipefs",
+    "securityfs", "selinuxfs", "sysfs", "tracefs",
+}
 os.makedirs(BACKUP_DIR, exist_ok=True)
 
+class LogWriter:
+    # One persistent handle, fed by a bounded queue and drained by a single
+    # writer thread that joins whatever is queued into one write per batch.
+    def __init__(self, path, queue_size=LOG_QUEUE_SIZE, batch_size=LOG_BATCH_SIZE,
+                 max_bytes=LOG_MAX_BYTES, max_age=LOG_MAX_AGE, backup_count=LOG_BACKUP_COUNT):
+        self.path = path
+        self.batch_size = batch_size
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.backup_count = backup_count
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.compressors = []
+        self._open()
+        self.thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self.thread.start()
+
+    def write(self, line):
+        self.queue.put(line)
+
+    def flush(self):
+        self.queue.join()
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        self.handle.close()
+        for compressor in self.compressors:
+            compressor.join()
+
+    def _open(self):
+        self.handle = open(self.path, "a")
+        st = os.fstat(self.handle.fileno())
+        self.inode = st.st_ino
+        self.size = st.st_size
+        self.started = _first_log_time(self.path, st.st_mtime) if st.st_size else time.time()
+
+    def _reopen_if_moved(self):
+        # Another toolkit process may have rotated the file under us.
+        try:
+            moved = os.stat(self.path).st_ino != self.inode
+        except FileNotFoundError:
+            moved = True
+        if moved:
+            self.handle.close()
+            self._open()
+
+    def _should_rotate(self, pending):
+        if self.size == 0:
+            return False
+        if self.max_bytes and self.size + pending > self.max_bytes:
+            return True
+        return bool(self.max_age) and time.time() - self.started >= self.max_age
+
+    def _rotate(self):
+        self.handle.close()
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        n = max((key[1] + 1 for key in _segment_index(self.path) if key[0] == stamp), default=0)
+        target = f"{self.path}.{stamp}-{n}" if n else f"{self.path}.{stamp}"
+        try:
+            os.rename(self.path, target)
+        except FileNotFoundError:
+            target = None
+        self._open()
+        if target:
+            self.compressors = [t for t in self.compressors if t.is_alive()]
+            thread = threading.Thread(target=compress_log_segment, args=(target, self.path, self.backup_count),
+                                      name="log-compress", daemon=True)
+            thread.start()
+            self.compressors.append(thread)
+
+    def _write(self, data):
+        self._reopen_if_moved()
+        if self._should_rotate(len(data)):
+            self._rotate()
+        self.handle.write(data)
+        self.handle.flush()
+        self.size += len(data)
+
+    def _drain(self, batch):
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        stopping = False
+        while True:
+            batch = self._drain([]) if stopping else self._drain([self.queue.get()])
+            lines = [line for line in batch if line is not None]
+            stopping = stopping or len(lines) != len(batch)
+            if lines:
+                try:
+                    self._write("".join(lines))
+                except OSError as e:
+                    print(f"[ERROR] Log write failed: {e}", file=sys.stderr)
+            for _ in batch:
+                self.queue.task_done()
+            if stopping and not batch:
+                return
+
+STAMP_RE = re.compile(rb"\d{4}-\d\d-\d\d \d\d:\d\d:\d\d")
+RELATIVE_TIME_RE = re.compile(r"(\d+)([smhd])")
+SEGMENT_RE = re.compile(r"\.(\d{8}-\d{6})(?:-(\d+))?(\.gz)?$")
+
+def _first_log_time(path, default):
+    try:
+        with open(path, "r") as f:
+            return time.mktime(time.strptime(f.read(19), "%Y-%m-%d %H:%M:%S"))
+    except (OSError, ValueError):
+        return default
+
+def _segment_index(path):
+    directory, name = os.path.split(path)
+    segments = {}
+    try:
+        entries = os.listdir(directory or ".")
+    except FileNotFoundError:
+        return segments
+    for entry in entries:
+        if not entry.startswith(name):
+            continue
+        match = SEGMENT_RE.fullmatch(entry[len(name):])
+        if match:
+            key = (match.group(1), int(match.group(2) or 0))
+            # A segment briefly exists both raw and compressed; either copy is complete.
+            if key not in segments or match.group(3):
+                segments[key] = os.path.join(directory, entry)
+    return segments
+
+def rotated_log_segments(path=LOGFILE):
+    segments = _segment_index(path)
+    return [segments[key] for key in sorted(segments)]
+
+def log_segments(path=LOGFILE):
+    segments = rotated_log_segments(path)
+    if os.path.exists(path):
+        segments.append(path)
+    return segments
+
+def open_log_segment(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt")
+    try:
+        return open(path, "r")
+    except FileNotFoundError:
+        if SEGMENT_RE.search(path) is None:
+            raise
+        return gzip.open(path + ".gz", "rt")
+
+def iter_log_lines(path=LOGFILE):
+    for segment in log_segments(path):
+        with open_log_segment(segment) as f:
+            yield from f
+
+def tail_lines(path, n, block_size=LOG_TAIL_BLOCK):
+    # Read fixed-size blocks backwards from EOF until n + 1 newlines are seen,
+    # so the cost depends on n and line length, never on the file size.
+    if n <= 0:
+        return []
+    with open(path, "rb") as f:
+        pos = f.seek(0, os.SEEK_END)
+        blocks = []
+        newlines = 0
+        while pos > 0 and newlines <= n:
+            step = min(block_size, pos)
+            pos -= step
+            f.seek(pos)
+            block = f.read(step)
+            blocks.append(block)
+            newlines += block.count(b"\n")
+    lines = b"".join(reversed(blocks)).splitlines(keepends=True)
+    if pos > 0:
+        lines = lines[1:]
+    return [line.decode(errors="replace") for line in lines[-n:]]
+
+def _tail_segment(segment, n):
+    if not segment.endswith(".gz"):
+        try:
+            return tail_lines(segment, n)
+        except FileNotFoundError:
+            if SEGMENT_RE.search(segment) is None:
+                raise
+    # Compressed archives cannot be read backwards; they are bounded by LOG_MAX_BYTES.
+    with open_log_segment(segment) as f:
+        return list(collections.deque(f, maxlen=n))
+
+def tail_log(n=LOG_TAIL_LINES, path=LOGFILE):
+    lines = []
+    for segment in reversed(log_segments(path)):
+        lines[:0] = _tail_segment(segment, n - len(lines))
+        if len(lines) >= n:
+            break
+    return lines
+
+def parse_log_time(value):
+    # Absolute times are normalised to the log's own sortable prefix;
+    # "90s", "30m", "1h", "2d" mean that long before now.
+    value = value.strip()
+    match = RELATIVE_TIME_RE.fullmatch(value)
+    if match:
+        seconds = int(match.group(1)) * {"s": 1, "m": 60, "h": 3600, "d": 86400}[match.group(2)]
+        return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(time.time() - seconds))
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(value, fmt).strftime("%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            pass
+    raise argparse.ArgumentTypeError(f"invalid time: {value!r}")
+
+def _line_stamp(line):
+    return line[:19].decode() if STAMP_RE.match(line) else None
+
+def _next_stamped_line(f, pos, size):
+    # Resync to the first line starting at or after pos, then skip
+    # continuation lines until one carries a timestamp.
+    if pos > 0:
+        f.seek(pos - 1)
+        f.readline()
+    else:
+        f.seek(0)
+    while True:
+        start = f.tell()
+        if start >= size:
+            return size, None
+        stamp = _line_stamp(f.readline())
+        if stamp is not None:
+            return start, stamp
+
+def seek_log_time(f, since):
+    size = f.seek(0, os.SEEK_END)
+    lo, hi = 0, size
+    while lo < hi:
+        mid = (lo + hi) // 2
+        _, stamp = _next_stamped_line(f, mid, size)
+        if stamp is None or stamp >= since:
+            hi = mid
+        else:
+            lo = mid + 1
+    start, _ = _next_stamped_line(f, lo, size)
+    f.seek(start)
+    return start
+
+def _segment_end_time(segment):
+    match = SEGMENT_RE.search(segment)
+    if match is None:
+        return None
+    return datetime.strptime(match.group(1), "%Y%m%d-%H%M%S").strftime("%Y-%m-%d %H:%M:%S")
+
+def iter_log_range(since=None, until=None, path=LOGFILE):
+    for segment in log_segments(path):
+        # A rotated segment only holds lines written before its rotation time.
+        end = _segment_end_time(segment)
+        if since and end and end < since:
+            continue
+        if segment.endswith(".gz") or not os.path.exists(segment):
+            f = open_log_segment(segment)
+            lines = (line.encode() for line in f)
+        else:
+            f = open(segment, "rb")
+            if since:
+                seek_log_time(f, since)
+            lines = f
+        with f:
+            for line in lines:
+                stamp = _line_stamp(line)
+                if stamp is not None:
+                    if since and stamp < since:
+                        continue
+                    if until and stamp > until:
+                        return
+                yield line.decode(errors="replace")
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_CLOEXEC = 0o2000000
+INOTIFY_EVENT = struct.Struct("iIII")
+
+class Inotify:
+    def __init__(self):
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            self._init = libc.inotify_init1
+            self._add_watch = libc.inotify_add_watch
+            self._rm_watch = libc.inotify_rm_watch
+        except (OSError, AttributeError) as e:
+            raise OSError(f"inotify unavailable: {e}")
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = self._init(IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    def add_watch(self, path, mask):
+        wd = self._add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {path}")
+        return wd
+
+    def rm_watch(self, wd):
+        self._rm_watch(self.fd, wd)
+
+    def read(self):
+        # Blocks in the kernel until something happens; idle followers cost nothing.
+        data = os.read(self.fd, 64 * 1024)
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            events.append((wd, mask, name))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+class LogFollower:
+    def __init__(self, path, out):
+        self.path = path
+        self.out = out
+        self.handle = None
+        self.wd = None
+        self.notifier = None
+
+    def _emit(self):
+        if self.handle is None:
+            return
+        if os.fstat(self.handle.fileno()).st_size < self.handle.tell():
+            self.out.write("--- log truncated ---\n")
+            self.handle.seek(0)
+        data = self.handle.read()
+        if data:
+            self.out.write(data.decode(errors="replace"))
+            self.out.flush()
+
+    def _switch(self, from_start):
+        try:
+            handle = open(self.path, "rb")
+        except FileNotFoundError:
+            return
+        if self.handle is not None:
+            self._emit()
+            self.handle.close()
+        if self.notifier is not None:
+            if self.wd is not None:
+                self.notifier.rm_watch(self.wd)
+            self.wd = self.notifier.add_watch(self.path, IN_MODIFY | IN_ATTRIB | IN_MOVE_SELF | IN_DELETE_SELF)
+        self.handle = handle
+        if not from_start:
+            handle.seek(0, os.SEEK_END)
+
+    def check(self):
+        # Emit whatever was appended, then move to a new file if LOGFILE was
+        # rotated or recreated, draining the old handle first.
+        self._emit()
+        try:
+            inode = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            return
+        if self.handle is None or inode != os.fstat(self.handle.fileno()).st_ino:
+            self._switch(from_start=True)
+            self._emit()
+
+    def run(self):
+        try:
+            self.notifier = Inotify()
+        except OSError:
+            self.notifier = None
+        try:
+            if self.notifier is not None:
+                directory = os.path.dirname(self.path) or "."
+                dir_wd = self.notifier.add_watch(directory, IN_CREATE | IN_MOVED_TO)
+                name = os.fsencode(os.path.basename(self.path))
+            self._switch(from_start=False)
+            while True:
+                if self.notifier is None:
+                    time.sleep(LOG_FOLLOW_POLL)
+                    self.check()
+                    continue
+                events = self.notifier.read()
+                if any(wd != dir_wd or event_name == name for wd, _, event_name in events):
+                    self.check()
+        finally:
+            if self.handle is not None:
+                self.handle.close()
+            if self.notifier is not None:
+                self.notifier.close()
+
+def follow_log(lines=LOG_FOLLOW_LINES, path=LOGFILE):
+    sys.stdout.write("".join(tail_log(lines, path)))
+    sys.stdout.flush()
+    LogFollower(path, sys.stdout).run()
+
+def compress_log_segment(segment, path=LOGFILE, backup_count=LOG_BACKUP_COUNT):
+    try:
+        with open(segment, "rb") as src, gzip.open(segment + ".gz.tmp", "wb") as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        os.rename(segment + ".gz.tmp", segment + ".gz")
+        os.unlink(segment)
+    except OSError as e:
+        print(f"[ERROR] Log compression failed: {e}", file=sys.stderr)
+    if backup_count:
+        for old in rotated_log_segments(path)[:-backup_count]:
+            try:
+                os.unlink(old)
+            except FileNotFoundError:
+                pass
+
+_log_writer = None
+_log_lock = threading.Lock()
+_log_stamp = (0, "")
+
+def _timestamp():
+    global _log_stamp
+    now = int(time.time())
+    stamp = _log_stamp
+    if stamp[0] != now:
+        stamp = (now, time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now)))
+        _log_stamp = stamp
+    return stamp[1]
+
+def get_log_writer():
+    global _log_writer
+    if _log_writer is None:
+        with _log_lock:
+            if _log_writer is None:
+                _log_writer = LogWriter(LOGFILE)
+    return _log_writer
+
 def log(message):
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    with open(LOGFILE, "a") as f:
-        f.write(f"{timestamp} : {message}\n")
+    get_log_writer().write(f"{_timestamp()} : {message}\n")
+
+def flush_log():
+    if _log_writer is not None:
+        _log_writer.flush()
+
+def close_log():
+    global _log_writer
+    with _log_lock:
+        writer, _log_writer = _log_writer, None
+    if writer is not None:
+        writer.close()
+
+atexit.register(close_log)
 
 def error_exit(message):
     print(f"[ERROR] {message}")
     log(f"ERROR: {message}")
     sys.exit(1)
 
-def monitor_system():
-    print("\n--- System Monitoring ---")
-    print(f"Hostname: {platform.node()}")
-    print(f"Uptime: {subprocess.getoutput('uptime -p')}")
-    print(f"Logged in users: {len(subprocess.getoutput('who').splitlines())}")
-    print("Memory Usage:\n", subprocess.getoutput('free -h'))
-    print("Disk Usage:\n", subprocess.getoutput('df -h'))
-    print("Top Processes:\n", subprocess.getoutput("ps aux --sort=-%mem | head -n 10"))
+def human_size(n):
+    for unit in ("B", "K", "M", "G", "T"):
+        if abs(n) < 1024 or unit == "T":
+            break
+        n /= 1024
+    return f"{n:.0f}{unit}" if unit == "B" or abs(n) >= 10 else f"{n:.1f}{unit}"
+
+def format_uptime(seconds):
+    minutes = int(seconds) // 60
+    parts = []
+    for name, size in (("week", 7 * 24 * 60), ("day", 24 * 60), ("hour", 60), ("minute", 1)):
+        count, minutes = divmod(minutes, size)
+        if count:
+            parts.append(f"{count} {name}{'s' if count != 1 else ''}")
+    return "up " + (", ".join(parts) or "0 minutes")
+
+_user_names = {}
+
+def user_name(uid):
+    if uid not in _user_names:
+        try:
+            _user_names[uid] = pwd.getpwuid(uid).pw_name
+        except KeyError:
+            _user_names[uid] = str(uid)
+    return _user_names[uid]
+
+def read_uptime():
+    with open("/proc/uptime") as f:
+        return float(f.read().split()[0])
+
+def read_meminfo():
+    info = {}
+    with open("/proc/meminfo") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            fields = value.split()
+            if fields:
+                info[key] = int(fields[0]) * (1024 if fields[1:] == ["kB"] else 1)
+    return info
+
+def read_proc_stat(pid):
+    # Fields after the parenthesised comm, which may itself contain spaces or ')'.
+    with open(f"/proc/{pid}/stat", "rb") as f:
+        data = f.read()
+    end = data.rindex(b")")
+    return data[data.index(b"(") + 1:end].decode(errors="replace"), data[end + 2:].split()
+
+def read_proc_uid(pid):
+    with open(f"/proc/{pid}/status", "rb") as f:
+        for line in f:
+            if line.startswith(b"Uid:"):
+                return int(line.split()[1])
+    return -1
+
+def read_proc_cmdline(pid, comm):
+    with open(f"/proc/{pid}/cmdline", "rb") as f:
+        cmdline = f.read().replace(b"\0", b" ").decode(errors="replace")
+    return " ".join(cmdline.split()) or f"[{comm}]"
+
+def collect_uptime():
+    return read_uptime()
+
+def collect_load():
+    with open("/proc/loadavg") as f:
+        return tuple(float(value) for value in f.read().split()[:3])
+
+UtmpEntry = collections.namedtuple("UtmpEntry", "type pid line user host login")
+
+def _utmp_str(value):
+    return value.split(b"\0", 1)[0].decode(errors="replace")
+
+def iter_utmp(path=UTMP_FILE):
+    # Streams glibc struct utmp records; wtmp uses the same layout.
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(UTMP_RECORD.size * 256)
+            if len(chunk) < UTMP_RECORD.size:
+                return
+            usable = len(chunk) - len(chunk) % UTMP_RECORD.size
+            for fields in UTMP_RECORD.iter_unpack(chunk[:usable]):
+                ut_type, pid, line, _, user, host, _, _, _, tv_sec, tv_usec, _ = fields
+                yield UtmpEntry(ut_type, pid, _utmp_str(line), _utmp_str(user), _utmp_str(host),
+                                tv_sec + tv_usec / 1e6)
+
+def read_sessions(path=UTMP_FILE):
+    try:
+        return [entry for entry in iter_utmp(path) if entry.type == UTMP_USER_PROCESS and entry.user]
+    except FileNotFoundError:
+        return []
+
+def iter_logins(path=WTMP_FILE):
+    for entry in iter_utmp(path):
+        if entry.type == UTMP_USER_PROCESS and entry.user:
+            yield entry
+
+def collect_users():
+    return len(read_sessions())
+
+def collect_memory():
+    info = read_meminfo()
+    total = info.get("MemTotal", 0)
+    available = info.get("MemAvailable", info.get("MemFree", 0))
+    swap_total = info.get("SwapTotal", 0)
+    swap_free = info.get("SwapFree", 0)
+    return {
+        "total": total,
+        "used": total - available,
+        "free": info.get("MemFree", 0),
+        "shared": info.get("Shmem", 0),
+        "buff_cache": info.get("Buffers", 0) + info.get("Cached", 0) + info.get("SReclaimable", 0),
+        "available": available,
+        "swap_total": swap_total,
+        "swap_used": swap_total - swap_free,
+        "swap_free": swap_free,
+    }
 
-def backup_home():
+def read_mounts():
+    mounts = {}
+    with open("/proc/self/mounts") as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) < 3 or fields[2] in PSEUDO_FILESYSTEMS:
+                continue
+            mount = re.sub(r"\\([0-7]{3})", lambda m: chr(int(m.group(1), 8)), fields[1])
+            mounts[mount] = (fields[0], fields[2])
+    return mounts
+
+def collect_disks():
+    disks = []
+    for mount, (device, fstype) in read_mounts().items():
+        try:
+            st = os.statvfs(mount)
+        except OSError:
+            continue
+        size = st.f_blocks * st.f_frsize
+        if size == 0:
+            continue
+        used = (st.f_blocks - st.f_bfree) * st.f_frsize
+        avail = st.f_bavail * st.f_frsize
+        disks.append({
+            "device": device,
+            "mount": mount,
+            "fstype": fstype,
+            "size": size,
+            "used": used,
+            "avail": avail,
+            "used_pct": 100.0 * used / (used + avail) if used + avail else 0.0,
+        })
+    return disks
+
+def _print_sessions(entries):
+    print(f"{'USER':<16}{'TTY':<12}{'LOGIN':<20}HOST")
+    for entry in entries:
+        login = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry.login))
+        print(f"{entry.user:<16}{entry.line:<12}{login:<20}{entry.host}")
+
+def show_sessions(history=False, limit=None):
+    if not history:
+        print("\n--- Logged In Sessions ---")
+        _print_sessions(read_sessions())
+        return
+    print("\n--- Login History ---")
+    try:
+        logins = iter_logins()
+        _print_sessions(collections.deque(logins, maxlen=limit) if limit else logins)
+    except FileNotFoundError:
+        print(f"{WTMP_FILE} not found.")
+
+class ProcessTable:
+    # Static fields (command line, owner) are cached per (pid, start time) and
+    # only looked up for processes that are actually displayed; each scan
+    # re-reads just /proc/[pid]/stat and derives CPU% from jiffy deltas.
+    def __init__(self):
+        self.entries = {}
+        self.scanned_at = None
+        self.interval = None
+
+    def scan(self):
+        now = time.monotonic()
+        boot_jiffies = read_uptime() * CLK_TCK
+        elapsed = now - self.scanned_at if self.scanned_at is not None else None
+        entries = {}
+        for name in os.listdir("/proc"):
+            if not name.isdigit():
+                continue
+            pid = int(name)
+            try:
+                comm, fields = read_proc_stat(pid)
+            except (OSError, ValueError):
+                continue
+            start = int(fields[19])
+            jiffies = int(fields[11]) + int(fields[12])
+            proc = self.entries.get(pid)
+            if proc is None or proc["start"] != start or not elapsed:
+                age = boot_jiffies - start
+                cpu_pct = 100.0 * jiffies / age if age > 0 else 0.0
+                if proc is None or proc["start"] != start:
+                    proc = {"pid": pid, "start": start, "comm": comm, "user": None, "command": None}
+            else:
+                cpu_pct = 100.0 * (jiffies - proc["jiffies"]) / (elapsed * CLK_TCK)
+            proc["ppid"] = int(fields[1])
+            proc["jiffies"] = jiffies
+            proc["cpu_pct"] = cpu_pct
+            proc["rss"] = int(fields[21]) * PAGE_SIZE
+            entries[pid] = proc
+        self.entries = entries
+        self.scanned_at = now
+        self.interval = elapsed
+        return entries
+
+    def describe(self, proc):
+        if proc["command"] is None:
+            try:
+                proc["user"] = user_name(read_proc_uid(proc["pid"]))
+                proc["command"] = read_proc_cmdline(proc["pid"], proc["comm"])
+            except OSError:
+                proc["user"], proc["command"] = "?", f"[{proc['comm']}]"
+        return proc
+
+    def top(self, k, key="rss"):
+        return [self.describe(proc) for proc in heapq.nlargest(k, self.entries.values(), key=lambda p: p[key])]
+
+_process_table = ProcessTable()
+
+def build_process_tree(entries):
+    # Parent -> children index plus subtree totals, from one table scan.
+    # Totals are accumulated over the reversed preorder so deep chains
+    # need no recursion.
+    children = collections.defaultdict(list)
+    roots = []
+    for pid, proc in entries.items():
+        if proc["ppid"] in entries and proc["ppid"] != pid:
+            children[proc["ppid"]].append(pid)
+        else:
+            roots.append(pid)
+    order = []
+    stack = list(roots)
+    while stack:
+        pid = stack.pop()
+        order.append(pid)
+        stack.extend(children.get(pid, ()))
+    totals = {pid: [entries[pid]["rss"], entries[pid]["cpu_pct"], 1] for pid in order}
+    for pid in reversed(order):
+        parent = entries[pid]["ppid"]
+        if parent in totals and parent != pid:
+            total, own = totals[parent], totals[pid]
+            total[0] += own[0]
+            total[1] += own[1]
+            total[2] += own[2]
+    return roots, children, totals
+
+def show_process_tree(root=None, depth=None):
+    print("\n--- Process Tree ---")
+    entries = _process_table.scan()
+    roots, children, totals = build_process_tree(entries)
+    if root is not None:
+        if root not in entries:
+            print(f"No process with PID {root}.")
+            return
+        roots = [root]
+    print(f"{'PID':>8}{'RSS':>9}{'TREE RSS':>10}{'TREE %CPU':>10}{'PROCS':>7}  COMMAND")
+    by_size = lambda pid: totals[pid][0]
+    stack = [(pid, 0, "", "") for pid in sorted(roots, key=by_size)]
+    while stack:
+        pid, level, branch, indent = stack.pop()
+        proc = entries[pid]
+        tree_rss, tree_cpu, count = totals[pid]
+        print(f"{pid:>8}{human_size(proc['rss']):>9}{human_size(tree_rss):>10}{tree_cpu:>10.1f}{count:>7}  "
+              f"{indent}{branch}{proc['comm']}")
+        if depth is not None and level >= depth:
+            continue
+        kids = sorted(children.get(pid, ()), key=by_size)
+        child_indent = indent + ("   " if branch.startswith("└") else "│  " if branch else "")
+        for i, child in enumerate(kids):
+            stack.append((child, level + 1, "└─ " if i == 0 else "├─ ", child_indent))
+
+def collect_processes(limit=TOP_PROCESSES, sort="rss"):
+    mem_total = read_meminfo().get("MemTotal", 1)
+    _process_table.scan()
+    return [dict(proc, mem_pct=100.0 * proc["rss"] / mem_total) for proc in _process_table.top(limit, sort)]
+
+class CollectorFailure:
+    def __init__(self, reason):
+        self.reason = reason
+
+    def __str__(self):
+        return self.reason
+
+_collectors_in_flight = {}
+
+def _start_collector(name, collector):
+    # A collector stuck in the kernel (e.g. statvfs on a dead NFS mount) cannot
+    # be cancelled. Reuse its pending future instead of piling up threads, and
+    # use daemon threads so it never blocks interpreter exit the way
+    # ThreadPoolExecutor workers would.
+    future = _collectors_in_flight.get(name)
+    if future is not None and not future.done():
+        return future
+    future = concurrent.futures.Future()
+
+    def work():
+        future.set_running_or_notify_cancel()
+        try:
+            future.set_result(collector())
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=work, name=f"collector-{name}", daemon=True).start()
+    _collectors_in_flight[name] = future
+    return future
+
+def run_collectors(collectors, timeouts=COLLECTOR_TIMEOUTS, default_timeout=COLLECTOR_TIMEOUT):
+    started = time.monotonic()
+    futures = {name: _start_collector(name, collector) for name, collector in collectors.items()}
+    results = {}
+    for name, future in futures.items():
+        remaining = started + timeouts.get(name, default_timeout) - time.monotonic()
+        try:
+            results[name] = future.result(timeout=max(0.0, remaining))
+        except concurrent.futures.TimeoutError:
+            results[name] = CollectorFailure("timed out")
+        except Exception as e:
+            results[name] = CollectorFailure(f"failed: {e}")
+    return results
+
+def _cgroup_dir(controllers, path):
+    # Inside a cgroup namespace the listed path may not exist under the
+    # mount; the mount root is then the container's own group.
+    for name in (controllers, *controllers.split(",")):
+        base = os.path.join(CGROUP_ROOT, name)
+        if os.path.isdir(base):
+            scoped = os.path.join(base, path.strip("/")) if path.strip("/") else base
+            return scoped if os.path.isdir(scoped) else base
+    return None
+
+def detect_cgroup():
+    try:
+        with open("/proc/self/cgroup") as f:
+            entries = [line.rstrip("\n").split(":", 2) for line in f]
+    except OSError:
+        return None
+    if os.path.exists(os.path.join(CGROUP_ROOT, "cgroup.controllers")):
+        path = next((entry[2] for entry in entries if entry[0] == "0"), "/")
+        scoped = os.path.join(CGROUP_ROOT, path.strip("/")) if path.strip("/") else CGROUP_ROOT
+        return {"version": 2, "dir": scoped if os.path.isdir(scoped) else CGROUP_ROOT}
+    dirs = {}
+    for _, controllers, path in entries:
+        for controller in ("memory", "cpu", "blkio"):
+            if controller in controllers.split(",") and controller not in dirs:
+                dirs[controller] = _cgroup_dir(controllers, path)
+    if not any(dirs.values()):
+        return None
+    return {"version": 1, **{controller: directory for controller, directory in dirs.items() if directory}}
+
+CGROUP = detect_cgroup()
+
+def _read_cgroup_value(directory, name):
+    if directory is None:
+        return None
+    try:
+        with open(os.path.join(directory, name)) as f:
+            value = f.read().strip()
+    except OSError:
+        return None
+    if value == "max":
+        return None
+    value = int(value)
+    return None if value >= CGROUP_UNLIMITED else value
+
+def _read_cgroup_keyed(directory, name):
+    values = {}
+    if directory is None:
+        return values
+    try:
+        with open(os.path.join(directory, name)) as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) == 2 and fields[1].isdigit():
+                    values[fields[0]] = int(fields[1])
+    except OSError:
+        pass
+    return values
+
+def _cgroup_v2(directory):
+    result = {
+        "memory_used": _read_cgroup_value(directory, "memory.current"),
+        "memory_limit": _read_cgroup_value(directory, "memory.max"),
+        "cpu_limit": None,
+    }
+    try:
+        with open(os.path.join(directory, "cpu.max")) as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            result["cpu_limit"] = int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    cpu = _read_cgroup_keyed(directory, "cpu.stat")
+    result["nr_periods"] = cpu.get("nr_periods")
+    result["nr_throttled"] = cpu.get("nr_throttled")
+    result["throttled_seconds"] = cpu["throttled_usec"] / 1e6 if "throttled_usec" in cpu else None
+    io = {"rbytes": 0, "wbytes": 0, "rios": 0, "wios": 0}
+    try:
+        with open(os.path.join(directory, "io.stat")) as f:
+            for line in f:
+                for pair in line.split()[1:]:
+                    key, _, value = pair.partition("=")
+                    if key in io:
+                        io[key] += int(value)
+    except OSError:
+        io = dict.fromkeys(io)
+    result.update(io_read_bytes=io["rbytes"], io_write_bytes=io["wbytes"], io_reads=io["rios"], io_writes=io["wios"])
+    return result
+
+def _blkio_totals(directory, name):
+    totals = {"Read": None, "Write": None}
+    if directory is None:
+        return totals
+    try:
+        with open(os.path.join(directory, name)) as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) == 3 and fields[1] in totals:
+                    totals[fields[1]] = (totals[fields[1]] or 0) + int(fields[2])
+    except OSError:
+        pass
+    return totals
+
+def _cgroup_v1(cgroup):
+    memory, cpu_dir, blkio = cgroup.get("memory"), cgroup.get("cpu"), cgroup.get("blkio")
+    result = {
+        "memory_used": _read_cgroup_value(memory, "memory.usage_in_bytes"),
+        "memory_limit": _read_cgroup_value(memory, "memory.limit_in_bytes"),
+        "cpu_limit": None,
+    }
+    quota = _read_cgroup_value(cpu_dir, "cpu.cfs_quota_us")
+    period = _read_cgroup_value(cpu_dir, "cpu.cfs_period_us")
+    if quota is not None and quota > 0 and period:
+        result["cpu_limit"] = quota / period
+    cpu = _read_cgroup_keyed(cpu_dir, "cpu.stat")
+    result["nr_periods"] = cpu.get("nr_periods")
+    result["nr_throttled"] = cpu.get("nr_throttled")
+    result["throttled_seconds"] = cpu["throttled_time"] / 1e9 if "throttled_time" in cpu else None
+    service_bytes = _blkio_totals(blkio, "blkio.throttle.io_service_bytes")
+    serviced = _blkio_totals(blkio, "blkio.throttle.io_serviced")
+    result.update(io_read_bytes=service_bytes["Read"], io_write_bytes=service_bytes["Write"],
+                  io_reads=serviced["Read"], io_writes=serviced["Write"])
+    return result
+
+def collect_cgroup():
+    if CGROUP is None:
+        return None
+    result = _cgroup_v2(CGROUP["dir"]) if CGROUP["version"] == 2 else _cgroup_v1(CGROUP)
+    result["version"] = CGROUP["version"]
+    host_memory = read_meminfo().get("MemTotal")
+    limit = result["memory_limit"]
+    result["memory_effective_limit"] = min(limit, host_memory) if limit and host_memory else (limit or host_memory)
+    result["host_cpus"] = os.cpu_count()
+    return result
+
+class CounterSampler:
+    # Cumulative per-device kernel counters kept in preallocated arrays.
+    # Every sample() overwrites them in place and turns the difference to
+    # the previous sample into per-second rates. Only the counter and rate
+    # storage is reused; parsing and report() still build per-device rows.
+    fields = ()
+
+    def __init__(self, capacity=16):
+        self.slots = {}
+        self.devices = []
+        self._allocate(capacity)
+        self.sampled_at = None
+        self.interval = None
+
+    def _allocate(self, capacity):
+        width = len(self.fields)
+        self.capacity = capacity
+        self.previous = array("Q", bytes(8 * width * capacity))
+        self.current = array("Q", bytes(8 * width * capacity))
+        self.rates = array("d", bytes(8 * width * capacity))
+        self.valid = array("B", bytes(capacity))
+        self.ready = array("B", bytes(capacity))
+        self.present = array("B", bytes(capacity))
+
+    def _slot(self, device):
+        slot = self.slots.get(device)
+        if slot is None:
+            if len(self.devices) == self.capacity:
+                previous, current, rates = self.previous, self.current, self.rates
+                valid, ready, present = self.valid, self.ready, self.present
+                self._allocate(self.capacity * 2)
+                self.previous[:len(previous)] = previous
+                self.current[:len(current)] = current
+                self.rates[:len(rates)] = rates
+                self.valid[:len(valid)] = valid
+                self.ready[:len(ready)] = ready
+                self.present[:len(present)] = present
+            slot = self.slots[device] = len(self.devices)
+            self.devices.append(device)
+        return slot
+
+    def read(self):
+        raise NotImplementedError
+
+    def sample(self):
+        now = time.monotonic()
+        width = len(self.fields)
+        for slot in range(len(self.devices)):
+            self.present[slot] = 0
+        for device, values in self.read():
+            slot = self._slot(device)
+            base = slot * width
+            for i in range(width):
+                self.current[base + i] = values[i]
+            self.present[slot] = 1
+        self.interval = now - self.sampled_at if self.sampled_at is not None else None
+        for slot in range(len(self.devices)):
+            base = slot * width
+            if not self.present[slot]:
+                self.valid[slot] = self.ready[slot] = 0
+                continue
+            # A device seen for the first time, or back after a gap, has no
+            # previous counters of its own; its old rates must not resurface.
+            if self.interval and self.valid[slot]:
+                for i in range(base, base + width):
+                    delta = self.current[i] - self.previous[i]
+                    self.rates[i] = delta / self.interval if delta >= 0 else 0.0
+                self.ready[slot] = 1
+            else:
+                for i in range(base, base + width):
+                    self.rates[i] = 0.0
+                self.ready[slot] = 0
+            self.valid[slot] = 1
+        self.previous, self.current = self.current, self.previous
+        self.sampled_at = now
+
+    def report(self):
+        # Snapshot for rendering: totals always, rates once a device has two
+        # consecutive samples.
+        width = len(self.fields)
+        rows = []
+        for slot, device in enumerate(self.devices):
+            if not self.present[slot]:
+                continue
+            base = slot * width
+            row = {"device": device}
+            for i, field in enumerate(self.fields):
+                row[field] = self.previous[base + i]
+                row[f"{field}_per_s"] = self.rates[base + i] if self.ready[slot] else None
+            rows.append(row)
+        return rows
+
+class NetDevSampler(CounterSampler):
+    fields = ("rx_bytes", "rx_packets", "tx_bytes", "tx_packets")
+
+    def read(self):
+        with open("/proc/net/dev", "rb") as f:
+            for line in f.readlines()[2:]:
+                name, _, counters = line.partition(b":")
+                values = counters.split()
+                yield name.strip().decode(), (int(values[0]), int(values[1]), int(values[8]), int(values[9]))
+
+_net_sampler = NetDevSampler()
+
+def collect_network():
+    _net_sampler.sample()
+    return _net_sampler.report()
+
+class DiskStatsSampler(CounterSampler):
+    fields = ("reads", "sectors_read", "read_ms", "writes", "sectors_written", "write_ms", "io_ms", "weighted_ms")
+    columns = (3, 5, 6, 7, 9, 10, 12, 13)
+
+    def __init__(self, capacity=16):
+        super().__init__(capacity)
+        self.whole_disks = {}
+
+    def _whole_disk(self, name):
+        # Partitions have no /sys/block entry; loop and ram devices are noise.
+        whole = self.whole_disks.get(name)
+        if whole is None:
+            whole = self.whole_disks[name] = (os.path.exists(f"/sys/block/{name.replace('/', '!')}")
+                                              and not name.startswith(("loop", "ram")))
+        return whole
+
+    def read(self):
+        with open("/proc/diskstats", "rb") as f:
+            for line in f:
+                parts = line.split()
+                name = parts[2].decode()
+                if len(parts) >= 14 and self._whole_disk(name):
+                    yield name, [int(parts[column]) for column in self.columns]
+
+    def report(self):
+        rows = super().report()
+        for row in rows:
+            if row["reads_per_s"] is None:
+                row.update(iops=None, read_bps=None, write_bps=None, queue_depth=None, await_ms=None, util_pct=None)
+                continue
+            ios = row["reads_per_s"] + row["writes_per_s"]
+            row["iops"] = ios
+            row["read_bps"] = row["sectors_read_per_s"] * 512
+            row["write_bps"] = row["sectors_written_per_s"] * 512
+            row["queue_depth"] = row["weighted_ms_per_s"] / 1000
+            row["await_ms"] = (row["read_ms_per_s"] + row["write_ms_per_s"]) / ios if ios else 0.0
+            row["util_pct"] = min(100.0, row["io_ms_per_s"] / 10)
+        return rows
+
+_diskstats_sampler = DiskStatsSampler()
+
+def collect_disk_io():
+    _diskstats_sampler.sample()
+    return _diskstats_sampler.report()
+
+def collect_system(sort="rss"):
+    snapshot = run_collectors({
+        "uptime": collect_uptime,
+        "load": collect_load,
+        "users": collect_users,
+        "memory": collect_memory,
+        "disks": collect_disks,
+        "disk_io": collect_disk_io,
+        "network": collect_network,
+        "cgroup": collect_cgroup,
+        "processes": functools.partial(collect_processes, sort=sort),
+    })
+    snapshot["hostname"] = platform.node()
+    snapshot["intervals"] = {
+        "disk_io": _diskstats_sampler.interval,
+        "network": _net_sampler.interval,
+        "processes": _process_table.interval,
+    }
+    return snapshot
+
+def _failed(snapshot, *names):
+    return any(isinstance(snapshot.get(name), CollectorFailure) for name in names)
+
+def render_system(snapshot):
+    print(f"Hostname: {snapshot['hostname']}")
+    uptime = snapshot["uptime"]
+    print(f"Uptime: {uptime if _failed(snapshot, 'uptime') else format_uptime(uptime)}")
+    load = snapshot["load"]
+    print(f"Load average: {load if _failed(snapshot, 'load') else ', '.join(f'{value:.2f}' for value in load)}")
+    print(f"Logged in users: {snapshot['users']}")
+    render_memory(snapshot)
+    render_cgroup(snapshot)
+    render_disks(snapshot)
+    render_disk_io(snapshot)
+    render_network(snapshot)
+    render_processes(snapshot)
+
+def render_memory(snapshot):
+    mem = snapshot["memory"]
+    if _failed(snapshot, "memory"):
+        print(f"Memory Usage: {mem}")
+        return
+    print("Memory Usage:")
+    print(f"{'':8}{'total':>10}{'used':>10}{'free':>10}{'shared':>10}{'buff/cache':>12}{'available':>11}")
+    print(f"{'Mem:':8}{human_size(mem['total']):>10}{human_size(mem['used']):>10}{human_size(mem['free']):>10}"
+          f"{human_size(mem['shared']):>10}{human_size(mem['buff_cache']):>12}{human_size(mem['available']):>11}")
+    print(f"{'Swap:':8}{human_size(mem['swap_total']):>10}{human_size(mem['swap_used']):>10}"
+          f"{human_size(mem['swap_free']):>10}")
+
+def render_cgroup(snapshot):
+    cgroup = snapshot.get("cgroup")
+    if _failed(snapshot, "cgroup"):
+        print(f"Container Limits: {cgroup}")
+        return
+    if cgroup is None:
+        return
+    print(f"Container Limits (cgroup v{cgroup['version']}):")
+    used, limit = cgroup["memory_used"], cgroup["memory_effective_limit"]
+    if used is not None and limit:
+        scope = "limit" if cgroup["memory_limit"] and cgroup["memory_limit"] <= limit else "host memory, no limit"
+        print(f"  Memory: {human_size(used)} / {human_size(limit)} ({100.0 * used / limit:.1f}%, {scope})")
+    cpus = cgroup["cpu_limit"]
+    quota = f"{cpus:.2f} of {cgroup['host_cpus']} CPUs" if cpus else f"no quota ({cgroup['host_cpus']} CPUs)"
+    throttled = ""
+    if cgroup["nr_periods"]:
+        throttled = (f", throttled {cgroup['nr_throttled']}/{cgroup['nr_periods']} periods"
+                     f" ({100.0 * cgroup['nr_throttled'] / cgroup['nr_periods']:.1f}%)")
+        if cgroup["throttled_seconds"] is not None:
+            throttled += f" for {cgroup['throttled_seconds']:.1f}s"
+    print(f"  CPU: {quota}{throttled}")
+    if cgroup["io_read_bytes"] is not None:
+        print(f"  I/O: read {human_size(cgroup['io_read_bytes'])} ({cgroup['io_reads'] or 0} ops), "
+              f"written {human_size(cgroup['io_write_bytes'] or 0)} ({cgroup['io_writes'] or 0} ops)")
+
+def render_disks(snapshot):
+    if _failed(snapshot, "disks"):
+        print(f"Disk Usage: {snapshot['disks']}")
+        return
+    print("Disk Usage:")
+    print(f"{'Filesystem':<24}{'Size':>7}{'Used':>7}{'Avail':>7}{'Use%':>6}  Mounted on")
+    for disk in snapshot["disks"]:
+        print(f"{disk['device']:<24}{human_size(disk['size']):>7}{human_size(disk['used']):>7}"
+              f"{human_size(disk['avail']):>7}{disk['used_pct']:>5.0f}%  {disk['mount']}")
+
+def _rate(value, fmt):
+    return "-" if value is None else fmt(value)
+
+def _interval(snapshot, name):
+    # Rates cover whatever time has passed since the previous sample.
+    interval = snapshot.get("intervals", {}).get(name)
+    return f"over last {interval:.1f}s" if interval else None
+
+def render_disk_io(snapshot):
+    if _failed(snapshot, "disk_io"):
+        print(f"Disk I/O: {snapshot['disk_io']}")
+        return
+    print(f"Disk I/O ({_interval(snapshot, 'disk_io') or 'rates need a second sample'}):")
+    print(f"{'Device':<12}{'IOPS':>8}{'Read/s':>10}{'Write/s':>10}{'Queue':>8}{'Await':>10}{'Util':>7}")
+    for dev in snapshot["disk_io"]:
+        print(f"{dev['device']:<12}{_rate(dev['iops'], '{:.0f}'.format):>8}{_rate(dev['read_bps'], human_size):>10}"
+              f"{_rate(dev['write_bps'], human_size):>10}{_rate(dev['queue_depth'], '{:.2f}'.format):>8}"
+              f"{_rate(dev['await_ms'], '{:.1f}ms'.format):>10}{_rate(dev['util_pct'], '{:.0f}%'.format):>7}")
+
+def render_network(snapshot):
+    if _failed(snapshot, "network"):
+        print(f"Network: {snapshot['network']}")
+        return
+    print(f"Network ({_interval(snapshot, 'network') or 'rates need a second sample'}):")
+    print(f"{'Interface':<16}{'RX total':>10}{'RX/s':>10}{'pkt/s':>9}{'TX total':>10}{'TX/s':>10}{'pkt/s':>9}")
+    packets = "{:.0f}".format
+    for iface in snapshot["network"]:
+        print(f"{iface['device']:<16}{human_size(iface['rx_bytes']):>10}{_rate(iface['rx_bytes_per_s'], human_size):>10}"
+              f"{_rate(iface['rx_packets_per_s'], packets):>9}{human_size(iface['tx_bytes']):>10}"
+              f"{_rate(iface['tx_bytes_per_s'], human_size):>10}{_rate(iface['tx_packets_per_s'], packets):>9}")
+
+def render_processes(snapshot):
+    if _failed(snapshot, "processes"):
+        print(f"Top Processes: {snapshot['processes']}")
+        return
+    print(f"Top Processes (%CPU {_interval(snapshot, 'processes') or 'averaged since process start'}):")
+    print(f"{'USER':<12}{'PID':>8}{'%CPU':>6}{'%MEM':>6}{'RSS':>8}  COMMAND")
+    for proc in snapshot["processes"]:
+        print(f"{proc['user'][:12]:<12}{proc['pid']:>8}{proc['cpu_pct']:>6.1f}{proc['mem_pct']:>6.1f}"
+              f"{human_size(proc['rss']):>8}  {proc['command'][:80]}")
+
+def monitor_system(sort="rss"):
+    print("\n--- System Monitoring ---")
+    snapshot = collect_system(sort)
+    process_sample(metrics_from(snapshot))
+    render_system(snapshot)
+
+class SnapshotCache:
+    # The lock is held while collecting, so a burst of concurrent scrapes
+    # waits for one collection and shares its result until the TTL expires.
+    def __init__(self, collect, ttl=EXPORTER_TTL):
+        self.collect = collect
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.snapshot = None
+        self.taken = 0.0
+
+    def get(self):
+        with self.lock:
+            if self.snapshot is None or time.monotonic() - self.taken >= self.ttl:
+                self.snapshot = self.collect()
+                self.taken = time.monotonic()
+            return self.snapshot
+
+def _prom_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for value in labels.values())
+    return "{" + ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + "}"
+
+def render_prometheus(snapshot):
+    families = collections.OrderedDict()
+
+    def add(name, help_text, value, metric_type="gauge", **labels):
+        family = families.setdefault(name, [help_text, metric_type])
+        family.append(f"{name}{_prom_labels(labels)} {float(value)!r}")
+
+    for name in snapshot:
+        if name == "hostname":
+            continue
+        add("toolkit_collector_up", "Whether the collector finished before its deadline.",
+            0 if _failed(snapshot, name) else 1, collector=name)
+    if not _failed(snapshot, "uptime"):
+        add("toolkit_uptime_seconds", "Seconds since boot.", snapshot["uptime"])
+    if not _failed(snapshot, "load"):
+        for minutes, value in zip((1, 5, 15), snapshot["load"]):
+            add(f"toolkit_load{minutes}", f"{minutes}-minute load average.", value)
+    if not _failed(snapshot, "users"):
+        add("toolkit_logged_in_users", "Number of logged in user sessions.", snapshot["users"])
+    if not _failed(snapshot, "memory"):
+        memory = snapshot["memory"]
+        for kind in ("total", "used", "free", "shared", "buff_cache", "available"):
+            add("toolkit_memory_bytes", "Memory usage by kind.", memory[kind], kind=kind)
+        for kind in ("total", "used", "free"):
+            add("toolkit_swap_bytes", "Swap usage by kind.", memory[f"swap_{kind}"], kind=kind)
+    cgroup = snapshot.get("cgroup")
+    if cgroup and not _failed(snapshot, "cgroup"):
+        for kind, key in (("used", "memory_used"), ("limit", "memory_effective_limit")):
+            if cgroup[key] is not None:
+                add("toolkit_cgroup_memory_bytes", "Memory charged to the toolkit's cgroup and its effective limit.",
+                    cgroup[key], kind=kind)
+        if cgroup["cpu_limit"]:
+            add("toolkit_cgroup_cpu_limit_cpus", "CPU quota of the toolkit's cgroup.", cgroup["cpu_limit"])
+        if cgroup["nr_periods"] is not None:
+            add("toolkit_cgroup_cpu_periods_total", "CFS enforcement periods.", cgroup["nr_periods"], "counter")
+            add("toolkit_cgroup_cpu_throttled_periods_total", "CFS periods that were throttled.",
+                cgroup["nr_throttled"], "counter")
+        if cgroup["throttled_seconds"] is not None:
+            add("toolkit_cgroup_cpu_throttled_seconds_total", "Time spent throttled.", cgroup["throttled_seconds"],
+                "counter")
+    if not _failed(snapshot, "disks"):
+        for disk in snapshot["disks"]:
+            labels = {"device": disk["device"], "mountpoint": disk["mount"], "fstype": disk["fstype"]}
+            add("toolkit_filesystem_size_bytes", "Filesystem size.", disk["size"], **labels)
+            add("toolkit_filesystem_used_bytes", "Filesystem space in use.", disk["used"], **labels)
+            add("toolkit_filesystem_avail_bytes", "Filesystem space available to unprivileged users.",
+                disk["avail"], **labels)
+    if not _failed(snapshot, "disk_io"):
+        for dev in snapshot["disk_io"]:
+            add("toolkit_disk_reads_completed_total", "Reads completed.", dev["reads"], "counter", device=dev["device"])
+            add("toolkit_disk_writes_completed_total", "Writes completed.", dev["writes"], "counter", device=dev["device"])
+            add("toolkit_disk_read_bytes_total", "Bytes read.", dev["sectors_read"] * 512, "counter", device=dev["device"])
+            add("toolkit_disk_written_bytes_total", "Bytes written.", dev["sectors_written"] * 512, "counter",
+                device=dev["device"])
+            add("toolkit_disk_io_time_seconds_total", "Seconds spent doing I/O.", dev["io_ms"] / 1000, "counter",
+                device=dev["device"])
+            add("toolkit_disk_io_time_weighted_seconds_total", "Weighted seconds spent doing I/O.",
+                dev["weighted_ms"] / 1000, "counter", device=dev["device"])
+    if not _failed(snapshot, "network"):
+        for iface in snapshot["network"]:
+            for field in NetDevSampler.fields:
+                direction, unit = field.split("_")
+                add(f"toolkit_network_{'receive' if direction == 'rx' else 'transmit'}_{unit}_total",
+                    f"Interface {unit} counter.", iface[field], "counter", device=iface["device"])
+    if not _failed(snapshot, "processes"):
+        for proc in snapshot["processes"]:
+            labels = {"pid": proc["pid"], "user": proc["user"], "comm": proc["comm"]}
+            add("toolkit_top_process_resident_bytes", "Resident memory of the top processes.", proc["rss"], **labels)
+            add("toolkit_top_process_cpu_percent", "CPU usage of the top processes.", proc["cpu_pct"], **labels)
+    lines = []
+    for name, (help_text, metric_type, *samples) in families.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        lines.extend(samples)
+    return "\n".join(lines) + "\n"
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus(self.server.snapshot_cache.get()).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve_metrics(bind=EXPORTER_BIND, port=EXPORTER_PORT, ttl=EXPORTER_TTL):
+    server = http.server.ThreadingHTTPServer((bind, port), MetricsHandler)
+    server.daemon_threads = True
+    server.snapshot_cache = SnapshotCache(collect_system, ttl)
+    print(f"Serving metrics on http://{bind}:{port}/metrics (snapshot TTL {ttl:g}s)")
+    log(f"Metrics exporter started on {bind}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print()
+    finally:
+        server.server_close()
+        log("Metrics exporter stopped")
+
+class HistoryStore:
+    # Fixed-size ring of packed float64 records (timestamp + HISTORY_METRICS)
+    # in a memory-mapped file. An append is one pack_into() into the map;
+    # window() hands back memoryviews over the mapped records, no copies.
+    def __init__(self, path=HISTORY_FILE, metrics=HISTORY_METRICS, capacity=HISTORY_CAPACITY):
+        self.path = path
+        self.metrics = metrics
+        self.capacity = capacity
+        self.width = 1 + len(metrics)
+        self.record = struct.Struct(f"<{self.width}d")
+        self.schema = zlib.crc32(",".join(metrics).encode())
+        size = HISTORY_HEADER_SIZE + capacity * self.record.size
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            header = os.pread(self.fd, HISTORY_HEADER.size, 0)
+            if (os.fstat(self.fd).st_size != size or len(header) != HISTORY_HEADER.size
+                    or HISTORY_HEADER.unpack(header)[:4] != (HISTORY_MAGIC, len(metrics), self.schema, capacity)):
+                # Different layout (or a fresh file): start an empty ring.
+                os.ftruncate(self.fd, 0)
+                os.ftruncate(self.fd, size)
+                os.pwrite(self.fd, HISTORY_HEADER.pack(HISTORY_MAGIC, len(metrics), self.schema, capacity, 0, 0), 0)
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        self.map = mmap.mmap(self.fd, size)
+
+    def _state(self):
+        _, _, _, _, head, count = HISTORY_HEADER.unpack_from(self.map, 0)
+        return head, count
+
+    def append(self, timestamp, sample):
+        values = [sample.get(name, math.nan) for name in self.metrics]
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            head, count = self._state()
+            self.record.pack_into(self.map, HISTORY_HEADER_SIZE + head * self.record.size, timestamp, *values)
+            HISTORY_HEADER.pack_into(self.map, 0, HISTORY_MAGIC, len(self.metrics), self.schema, self.capacity,
+                                     (head + 1) % self.capacity, min(count + 1, self.capacity))
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def _timestamp(self, oldest, index):
+        return struct.unpack_from("<d", self.map, HISTORY_HEADER_SIZE + (oldest + index) % self.capacity * self.record.size)[0]
+
+    def _bisect(self, oldest, count, timestamp):
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._timestamp(oldest, mid) < timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def window(self, since=None, until=None):
+        # Returns up to two (rows, width) float64 views, oldest first; the ring
+        # may wrap inside the requested window. The views pin the map, so the
+        # caller must release them before close().
+        head, count = self._state()
+        oldest = (head - count) % self.capacity
+        first = self._bisect(oldest, count, since) if since is not None else 0
+        last = self._bisect(oldest, count, math.nextafter(until, math.inf)) if until is not None else count
+        views = []
+        start = (oldest + first) % self.capacity
+        remaining = max(0, last - first)
+        while remaining:
+            rows = min(remaining, self.capacity - start)
+            offset = HISTORY_HEADER_SIZE + start * self.record.size
+            views.append(memoryview(self.map)[offset:offset + rows * self.record.size].cast("d", [rows, self.width]))
+            remaining -= rows
+            start = 0
+        return views
+
+    def close(self):
+        self.map.close()
+        os.close(self.fd)
+
+_history = None
+
+def record_history(sample, timestamp=None):
+    global _history
+    try:
+        if _history is None:
+            _history = HistoryStore()
+        _history.append(time.time() if timestamp is None else timestamp, sample)
+    except OSError as e:
+        log(f"History append failed: {e}")
+
+def _epoch(stamp):
+    return time.mktime(time.strptime(stamp, "%Y-%m-%d %H:%M:%S"))
+
+def show_history(since=None, until=None):
+    print("\n--- Monitor History ---")
+    store = HistoryStore()
+    try:
+        print(f"{'time':<20}" + "".join(f"{name:>15}" for name in store.metrics))
+        views = store.window(_epoch(since) if since else None, _epoch(until) if until else None)
+        try:
+            for view in views:
+                for row in range(view.shape[0]):
+                    stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(view[row, 0]))
+                    print(f"{stamp:<20}" + "".join(f"{view[row, col]:>15.2f}" for col in range(1, store.width)))
+        finally:
+            for view in views:
+                view.release()
+    finally:
+        store.close()
+
+class RingBuffer:
+    # Fixed-capacity float64 storage; appends overwrite the oldest sample.
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.values = array("d", bytes(8 * capacity))
+        self.index = 0
+        self.count = 0
+
+    def append(self, value):
+        self.values[self.index] = value
+        self.index = (self.index + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def window(self):
+        if self.count < self.capacity:
+            return self.values[:self.count]
+        return self.values[self.index:] + self.values[:self.index]
+
+    def summary(self):
+        values = sorted(self.window())
+        if not values:
+            return None
+        p95 = values[max(0, math.ceil(0.95 * len(values)) - 1)]
+        return values[0], values[-1], sum(values) / len(values), p95
+
+def metrics_from(snapshot):
+    # Flatten a collector snapshot into name -> float; failed collectors are left out.
+    sample = {}
+    if not _failed(snapshot, "memory"):
+        memory = snapshot["memory"]
+        sample["mem_used_pct"] = 100.0 * memory["used"] / memory["total"] if memory["total"] else 0.0
+        sample["swap_used_pct"] = 100.0 * memory["swap_used"] / memory["swap_total"] if memory["swap_total"] else 0.0
+    if not _failed(snapshot, "load"):
+        sample["load1"], sample["load5"], sample["load15"] = snapshot["load"]
+    cgroup = snapshot.get("cgroup")
+    if cgroup and not _failed(snapshot, "cgroup") and cgroup["memory_used"] is not None \
+            and cgroup["memory_effective_limit"]:
+        sample["cgroup_mem_used_pct"] = 100.0 * cgroup["memory_used"] / cgroup["memory_effective_limit"]
+    if not _failed(snapshot, "users"):
+        sample["users"] = float(snapshot["users"])
+    if not _failed(snapshot, "disks"):
+        for disk in snapshot["disks"]:
+            sample[f"disk_used_pct:{disk['mount']}"] = disk["used_pct"]
+            sample[f"disk_free:{disk['mount']}"] = float(disk["avail"])
+    if not _failed(snapshot, "disk_io"):
+        for dev in snapshot["disk_io"]:
+            if dev["iops"] is not None:
+                sample[f"disk_iops:{dev['device']}"] = dev["iops"]
+                sample[f"disk_await_ms:{dev['device']}"] = dev["await_ms"]
+                sample[f"disk_queue:{dev['device']}"] = dev["queue_depth"]
+                sample[f"disk_util_pct:{dev['device']}"] = dev["util_pct"]
+    if not _failed(snapshot, "network"):
+        for iface in snapshot["network"]:
+            if iface["rx_bytes_per_s"] is not None:
+                sample[f"net_rx_bytes_per_s:{iface['device']}"] = iface["rx_bytes_per_s"]
+                sample[f"net_tx_bytes_per_s:{iface['device']}"] = iface["tx_bytes_per_s"]
+    return sample
+
+def collect_sample():
+    return metrics_from(run_collectors({
+        "memory": collect_memory,
+        "load": collect_load,
+        "users": collect_users,
+        "disks": collect_disks,
+        "disk_io": collect_disk_io,
+        "network": collect_network,
+        "cgroup": collect_cgroup,
+    }))
+
+ALERT_RULE_RE = re.compile(
+    r"(?P<metric>\S+)\s*(?P<op><=|>=|<|>)\s*(?P<value>[\d.]+)\s*(?P<unit>[A-Za-z%]*)"
+    r"(?:\s+for\s+(?P<duration>\d+[smhd]))?"
+    r"(?:\s+clear\s+(?P<clear>[\d.]+)\s*(?P<clear_unit>[A-Za-z%]*))?")
+DISK_RULE_RE = re.compile(r"disk\s+(?P<mount>\S+)\s+(?P<field>free|used)\s+(?P<rest>.*)")
+ALERT_UNITS = {"": 1, "%": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3, "t": 1024 ** 4}
+ALERT_OPERATORS = {">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le}
+ALERT_CLEAR_OPERATORS = {">": operator.lt, ">=": operator.lt, "<": operator.gt, "<=": operator.gt}
+
+def _alert_number(value, unit):
+    key = unit.lower().rstrip("b").replace("i", "") if unit != "%" else unit
+    if key not in ALERT_UNITS:
+        raise ValueError(f"unknown unit {unit!r}")
+    return float(value) * ALERT_UNITS[key]
+
+class AlertRule:
+    # Compiled once: the metric key, comparison callables and thresholds are
+    # resolved up front so evaluation is a dict lookup and two comparisons.
+    __slots__ = ("text", "metric", "triggered", "cleared", "threshold", "clear", "duration", "pending_since", "firing")
+
+    def __init__(self, text):
+        self.text = text
+        line = text
+        disk = DISK_RULE_RE.fullmatch(line)
+        if disk:
+            prefix = "disk_free" if disk.group("field") == "free" else "disk_used_pct"
+            line = f"{prefix}:{disk.group('mount')} {disk.group('rest')}"
+        match = ALERT_RULE_RE.fullmatch(line)
+        if match is None:
+            raise ValueError(f"cannot parse alert rule {text!r}")
+        op = match.group("op")
+        self.metric = match.group("metric")
+        self.threshold = _alert_number(match.group("value"), match.group("unit"))
+        if match.group("clear"):
+            self.clear = _alert_number(match.group("clear"), match.group("clear_unit") or match.group("unit"))
+        else:
+            margin = abs(self.threshold) * ALERT_HYSTERESIS
+            self.clear = self.threshold - margin if op.startswith(">") else self.threshold + margin
+        self.triggered = ALERT_OPERATORS[op]
+        self.cleared = ALERT_CLEAR_OPERATORS[op]
+        duration = match.group("duration")
+        self.duration = 0.0
+        if duration:
+            self.duration = float(int(duration[:-1]) * {"s": 1, "m": 60, "h": 3600, "d": 86400}[duration[-1]])
+        self.pending_since = None
+        self.firing = False
+
+    def evaluate(self, value, now):
+        if self.firing:
+            if self.cleared(value, self.clear):
+                self.firing = False
+                self.pending_since = None
+                return "resolved"
+        elif self.triggered(value, self.threshold):
+            if self.pending_since is None:
+                self.pending_since = now
+            if now - self.pending_since >= self.duration:
+                self.firing = True
+                return "firing"
+        else:
+            self.pending_since = None
+        return None
+
+class AlertEngine:
+    def __init__(self, rules=()):
+        self.rules = list(rules)
+
+    @classmethod
+    def load(cls, path):
+        rules = []
+        with open(path) as f:
+            for number, line in enumerate(f, 1):
+                line = line.split("#", 1)[0].strip()
+                if not line:
+                    continue
+                try:
+                    rules.append(AlertRule(line))
+                except ValueError as e:
+                    raise ValueError(f"{path}:{number}: {e}")
+        return cls(rules)
+
+    def evaluate(self, sample, now=None):
+        now = time.monotonic() if now is None else now
+        events = []
+        for rule in self.rules:
+            value = sample.get(rule.metric)
+            if value is None:
+                continue
+            transition = rule.evaluate(value, now)
+            if transition is not None:
+                events.append((transition, rule, value))
+        for transition, rule, value in events:
+            message = f"ALERT {transition.upper()}: {rule.text} (value {value:.2f})"
+            log(message)
+            print(message)
+        return events
+
+_alert_engine = None
+
+def load_alert_rules(path=ALERT_RULES_FILE):
+    global _alert_engine
+    try:
+        _alert_engine = AlertEngine.load(path)
+    except FileNotFoundError:
+        _alert_engine = AlertEngine()
+    except ValueError as e:
+        print(f"[ERROR] Alert rules disabled: {e}")
+        log(f"ERROR: Alert rules disabled: {e}")
+        _alert_engine = AlertEngine()
+    return _alert_engine
+
+class AnomalyDetector:
+    # Per-metric online baseline in flat preallocated arrays: an EWMA mean and
+    # variance plus a P-square sketch (five markers) of the upper quantile.
+    # A sample is anomalous when it is more than ANOMALY_Z deviations from
+    # the EWMA mean and, on the high side, also above the learned quantile.
+    WIDTH = 18  # mean, variance, count, 5 heights, 5 positions, 5 desired positions
+
+    def __init__(self, quantile=ANOMALY_QUANTILE, alpha=ANOMALY_ALPHA, z=ANOMALY_Z,
+                 warmup=ANOMALY_WARMUP, capacity=32):
+        self.quantile = quantile
+        self.alpha = alpha
+        self.z = z
+        self.warmup = max(warmup, 5)
+        self.increments = (0.0, quantile / 2, quantile, (1 + quantile) / 2, 1.0)
+        self.slots = {}
+        self.state = array("d", bytes(8 * self.WIDTH * capacity))
+        self.flagged = array("B", bytes(capacity))
+
+    def _slot(self, name):
+        slot = self.slots.get(name)
+        if slot is None:
+            slot = self.slots[name] = len(self.slots)
+            if slot == len(self.flagged):
+                self.state.extend(array("d", bytes(8 * self.WIDTH * slot)))
+                self.flagged.extend(bytes(slot))
+        return slot
+
+    def _update_quantile(self, b, count, x):
+        s, p = self.state, self.quantile
+        q, n, d = b + 3, b + 8, b + 13
+        if count <= 5:
+            s[q + count - 1] = x
+            if count == 5:
+                s[q:q + 5] = array("d", sorted(s[q:q + 5]))
+                for i in range(5):
+                    s[n + i] = i + 1
+                s[d], s[d + 1], s[d + 2], s[d + 3], s[d + 4] = 1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5
+            return
+        if x < s[q]:
+            s[q] = x
+            k = 0
+        elif x >= s[q + 4]:
+            s[q + 4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= s[q + k + 1]:
+                k += 1
+        for i in range(k + 1, 5):
+            s[n + i] += 1
+        for i in range(5):
+            s[d + i] += self.increments[i]
+        for i in range(1, 4):
+            delta = s[d + i] - s[n + i]
+            if (delta >= 1 and s[n + i + 1] - s[n + i] > 1) or (delta <= -1 and s[n + i - 1] - s[n + i] < -1):
+                step = 1.0 if delta > 0 else -1.0
+                hi, mid, lo = s[q + i + 1], s[q + i], s[q + i - 1]
+                n_hi, n_mid, n_lo = s[n + i + 1], s[n + i], s[n + i - 1]
+                height = mid + step / (n_hi - n_lo) * ((n_mid - n_lo + step) * (hi - mid) / (n_hi - n_mid)
+                                                       + (n_hi - n_mid - step) * (mid - lo) / (n_mid - n_lo))
+                if not lo < height < hi:
+                    j = i + int(step)
+                    height = mid + step * (s[q + j] - mid) / (s[n + j] - n_mid)
+                s[q + i] = height
+                s[n + i] += step
+
+    def update(self, name, x):
+        slot = self._slot(name)
+        b = slot * self.WIDTH
+        s = self.state
+        count = s[b + 2] + 1
+        s[b + 2] = count
+        anomalous = False
+        if count > self.warmup:
+            mean = s[b]
+            std = max(math.sqrt(s[b + 1]), ANOMALY_MIN_STD * abs(mean), 1e-9)
+            deviation = (x - mean) / std
+            anomalous = deviation < -self.z or (deviation > self.z and x > s[b + 5])
+        if count == 1:
+            s[b] = x
+        else:
+            diff = x - s[b]
+            increment = self.alpha * diff
+            s[b] += increment
+            s[b + 1] = (1 - self.alpha) * (s[b + 1] + diff * increment)
+        self._update_quantile(b, int(count), x)
+        # Report only the transition into the anomalous state.
+        was_flagged = self.flagged[slot]
+        self.flagged[slot] = anomalous
+        return anomalous and not was_flagged
+
+    def baseline(self, name):
+        b = self.slots[name] * self.WIDTH
+        return self.state[b], math.sqrt(self.state[b + 1]), self.state[b + 5]
+
+    def observe(self, sample):
+        flagged = [name for name, value in sample.items() if self.update(name, value)]
+        for name in flagged:
+            mean, std, upper = self.baseline(name)
+            message = (f"ANOMALY: {name}={sample[name]:.2f} (baseline {mean:.2f} +/- {std:.2f}, "
+                       f"p{self.quantile * 100:g} {upper:.2f})")
+            log(message)
+            print(message)
+        return flagged
+
+_anomaly_detector = AnomalyDetector()
+
+def process_sample(sample):
+    record_history(sample)
+    (_alert_engine or load_alert_rules()).evaluate(sample)
+    _anomaly_detector.observe(sample)
+
+WATCH_STATUS = (
+    ("mem%", "mem_used_pct", "5.1f"),
+    ("swap%", "swap_used_pct", "5.1f"),
+    ("load", "load1", ".2f"),
+    ("users", "users", ".0f"),
+)
+
+def render_watch_summary(buffers):
+    print(f"{'metric':<40}{'min':>12}{'max':>12}{'mean':>12}{'p95':>12}")
+    for name, buffer in sorted(buffers.items()):
+        summary = buffer.summary()
+        if summary is None:
+            continue
+        fmt = human_size if name.startswith(("disk_free:", "net_")) else "{:.2f}".format
+        print(f"{name[:40]:<40}" + "".join(f"{fmt(value):>12}" for value in summary))
+
+def watch_system(interval=WATCH_INTERVAL, samples=WATCH_SAMPLES, iterations=None):
+    print(f"\n--- Watching System (every {interval:g}s, Ctrl-C to stop) ---")
+    buffers = {}
+    taken = 0
+    deadline = time.monotonic()
+    try:
+        while iterations is None or taken < iterations:
+            sample = collect_sample()
+            process_sample(sample)
+            for name, value in sample.items():
+                buffer = buffers.get(name)
+                if buffer is None:
+                    buffer = buffers[name] = RingBuffer(samples)
+                buffer.append(value)
+            taken += 1
+            status = "  ".join(f"{label} {sample[name]:{spec}}" if name in sample else f"{label} timed out"
+                               for label, name, spec in WATCH_STATUS)
+            print(f"{time.strftime('%H:%M:%S')}  {status}")
+            deadline += interval
+            time.sleep(max(0.0, deadline - time.monotonic()))
+    except KeyboardInterrupt:
+        print()
+    print(f"\n--- Summary of last {min(taken, samples)} samples ---")
+    render_watch_summary(buffers)
+
+def _gzip_member(data, level):
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+class ParallelGzipWriter:
+    # File-like sink for tarfile: whole chunks are gzipped on a process pool
+    # and written back in submission order as concatenated gzip members,
+    # which gunzip and tar -z read as a single stream. The futures queue is
+    # bounded, so a slow disk or slow workers stall the producer instead of
+    # buffering the archive in memory.
+    def __init__(self, path, workers=BACKUP_WORKERS, chunk_size=BACKUP_CHUNK_SIZE, level=BACKUP_COMPRESS_LEVEL):
+        self.chunk_size = chunk_size
+        self.level = level
+        self.buffer = bytearray()
+        self.error = None
+        self.file = open(path, "wb")
+        self.pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+        self.pending = queue.Queue(maxsize=2 * workers)
+        self.writer = threading.Thread(target=self._drain, name="gzip-writer", daemon=True)
+        self.writer.start()
+
+    def _drain(self):
+        while True:
+            future = self.pending.get()
+            if future is None:
+                return
+            try:
+                if self.error is None:
+                    self.file.write(future.result())
+            except BaseException as e:
+                self.error = e
+
+    def _submit(self, data):
+        if self.error is not None:
+            raise self.error
+        self.pending.put(self.pool.submit(_gzip_member, data, self.level))
+
+    def write(self, data):
+        self.buffer += data
+        while len(self.buffer) >= self.chunk_size:
+            self._submit(bytes(self.buffer[:self.chunk_size]))
+            del self.buffer[:self.chunk_size]
+        return len(data)
+
+    def close(self):
+        if self.file.closed:
+            return
+        try:
+            if self.buffer and self.error is None:
+                self._submit(bytes(self.buffer))
+            self.buffer.clear()
+        finally:
+            self.pending.put(None)
+            self.writer.join()
+            self.pool.shutdown()
+            self.file.close()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_IDLE = 3
+IOPRIO_CLASS_SHIFT = 13
+IOPRIO_SET_SYSCALLS = {
+    "x86_64": 251, "i386": 289, "i686": 289, "aarch64": 30, "riscv64": 30,
+    "armv7l": 314, "ppc64le": 273, "s390x": 282,
+}
+
+def set_idle_priority():
+    # Lowest CPU priority and the idle I/O class, so the disk is only used
+    # when nothing else wants it. Both are inherited, so this has to run
+    # before the backup pool and writer threads are started.
+    os.nice(19)
+    number = IOPRIO_SET_SYSCALLS.get(platform.machine())
+    try:
+        if number is None:
+            raise OSError(f"no ioprio_set syscall number for {platform.machine()}")
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        if libc.syscall(number, IOPRIO_WHO_PROCESS, 0, IOPRIO_CLASS_IDLE << IOPRIO_CLASS_SHIFT) < 0:
+            raise OSError(ctypes.get_errno(), "ioprio_set failed")
+    except OSError as e:
+        print(f"[ERROR] Idle I/O priority unavailable: {e}")
+        log(f"ERROR: Idle I/O priority unavailable: {e}")
+
+def parse_rate(value):
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([kKmMgGtT]?i?[bB]?)(?:/s)?\s*", value)
+    if match is None or float(match.group(1)) <= 0:
+        raise argparse.ArgumentTypeError(f"invalid rate: {value!r}")
+    return _alert_number(match.group(1), match.group(2))
+
+class TokenBucket:
+    # Read budget of rate bytes per second with up to one second of burst.
+    # Reads are charged after the fact; going into debt sleeps it off, so a
+    # read larger than the bucket still averages out to the rate.
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.stamp = time.monotonic()
+
+    def consume(self, amount):
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.stamp) * self.rate) - amount
+        self.stamp = now
+        if self.tokens < 0:
+            time.sleep(-self.tokens / self.rate)
+
+class ThrottledFile:
+    def __init__(self, f, bucket):
+        self.f = f
+        self.bucket = bucket
+
+    def read(self, size=-1):
+        data = self.f.read(size)
+        self.bucket.consume(len(data))
+        return data
+
+def backup_estimate(root, rules, manifest=None):
+    # Totals of the previous manifest when there is one, otherwise a
+    # stat-only pass over the tree; either is cheap next to reading it.
+    files = size = 0
+    if manifest is not None:
+        for entry in read_manifest(manifest):
+            if entry.kind == "f":
+                files += 1
+                size += entry.size
+    else:
+        for _, _, st in walk_home(root, rules):
+            if stat.S_ISREG(st.st_mode):
+                files += 1
+                size += st.st_size
+    return files, size
+
+class BackupProgress:
+    # Counts files and bytes covered and, when shown, prints throughput and
+    # an ETA against the estimate at most once per interval, rewriting one
+    # line on a terminal.
+    def __init__(self, total_files=0, total_bytes=0, show=True, interval=BACKUP_PROGRESS_INTERVAL):
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.show = show
+        self.interval = interval
+        self.tty = sys.stdout.isatty()
+        self.files = self.bytes = 0
+        self.start = self.shown = time.monotonic()
+
+    def update(self, files, size):
+        self.files += files
+        self.bytes += size
+        if self.show and time.monotonic() - self.shown >= self.interval:
+            self._render()
+
+    def _render(self, final=False):
+        self.shown = time.monotonic()
+        elapsed = max(self.shown - self.start, 1e-6)
+        rate = self.bytes / elapsed
+        # The estimate is taken before the walk and can fall short of what
+        # is actually read.
+        total_files, total_bytes = max(self.total_files, self.files), max(self.total_bytes, self.bytes)
+        remaining = total_bytes - self.bytes
+        if final:
+            eta = "done"
+        elif rate > 0 and remaining > 0:
+            eta = "ETA " + time.strftime("%H:%M:%S", time.gmtime(remaining / rate))
+        else:
+            eta = "ETA --:--:--"
+        if final:
+            percent = 100
+        else:
+            percent = min(99, 100 * self.bytes // total_bytes) if total_bytes else 0
+        line = (f"{human_size(self.bytes)}/{human_size(total_bytes)} ({percent}%) "
+                f"{self.files}/{total_files} files  {human_size(rate)}/s  "
+                f"{self.files / elapsed:.0f} files/s  {eta}")
+        if self.tty:
+            print("\r" + line.ljust(79), end="", flush=True)
+        else:
+            print(line, flush=True)
+
+    def finish(self):
+        if not self.show:
+            return
+        self.total_files, self.total_bytes = self.files, self.bytes
+        self._render(final=True)
+        if self.tty:
+            print()
+        elapsed = max(time.monotonic() - self.start, 1e-6)
+        log(f"Backup read {human_size(self.bytes)} in {self.files} files at {human_size(self.bytes / elapsed)}/s")
+
+class PaddedFile:
+    # Once tarfile has written a member's header it must write exactly the
+    # size it announced, or every later member is misaligned. A file that
+    # shrank since it was stat'ed is padded with zeros, as GNU tar does,
+    # and a read error at that point aborts the archive instead of being
+    # skipped like an ordinary unreadable file.
+    def __init__(self, f, path):
+        self.f = f
+        self.path = path
+        self.missing = 0
+
+    def read(self, size):
+        try:
+            data = self.f.read(size)
+        except OSError as e:
+            raise tarfile.TarError(f"reading {self.path} failed after its header was written: {e}")
+        if len(data) < size:
+            self.missing += size - len(data)
+            data += bytes(size - len(data))
+        return data
+
+def _add_to_archive(archive, path, bucket=None, arcname=None):
+    # Returns False for an entry skipped before anything was written for it.
+    try:
+        info = archive.gettarinfo(path, arcname)
+        f = open(path, "rb") if info is not None and info.isreg() else None
+    except OSError as e:
+        log(f"Backup skipped {path}: {e}")
+        return False
+    if info is None:
+        return False
+    if f is None:
+        archive.addfile(info)
+        return True
+    with f:
+        source = PaddedFile(f if bucket is None else ThrottledFile(f, bucket), path)
+        archive.addfile(info, source)
+    if source.missing:
+        log(f"Backup warning: {path} shrank while being archived, padded {source.missing} bytes with zeros")
+    return True
+
+def backup_home(limit=None, progress=True):
     print("\n--- Backing up home directory ---")
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     backup_file = os.path.join(BACKUP_DIR, f"home_backup_{timestamp}.tar.gz")
     home = os.path.expanduser("~")
-    try:
-        subprocess.run(["tar", "-czf", backup_file, home], check=True)
+    rules = _backup_rules or load_backup_rules()
+    skipped = collections.Counter()
+    bucket = TokenBucket(limit) if limit else None
+    meter = BackupProgress(*backup_estimate(home, rules)) if progress else BackupProgress(show=False)
+    try:
+        with ParallelGzipWriter(backup_file) as out, tarfile.open(fileobj=out, mode="w|") as archive:
+            archive.add(home, recursive=False)
+            for _, path, st in walk_home(home, rules, skipped):
+                _add_to_archive(archive, path, bucket)
+                if stat.S_ISREG(st.st_mode):
+                    meter.update(1, st.st_size)
+        meter.finish()
+        summary = _report_skipped(skipped)
         print(f"Backup saved to {backup_file}")
-        log(f"Backup created: {backup_file}")
-    except subprocess.CalledProcessError:
-        error_exit("Backup failed")
-
-def list_users():
-    print("\n--- User Listing ---")
+        log(f"Backup created: {backup_file} ({summary})")
+    except (OSError, tarfile.TarError) as e:
+        if os.path.exists(backup_file):
+            os.remove(backup_file)
+        error_exit(f"Backup failed: {e}")
+
+BackupEntry = collections.namedtuple("BackupEntry", "path kind mode size mtime_ns inode digest")
+
+def _escape_path(path):
+    return path.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
+
+def _unescape_path(text):
+    return re.sub(r"\\(.)", lambda m: {"t": "\t", "n": "\n"}.get(m.group(1), m.group(1)), text)
+
+def _entry_kind(mode):
+    if stat.S_ISDIR(mode):
+        return "d"
+    if stat.S_ISLNK(mode):
+        return "l"
+    if stat.S_ISREG(mode):
+        return "f"
+    return None
+
+def _glob_regex(pattern):
+    parts, i = [], 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            parts.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i):
+            parts.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            parts.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            parts.append("[^/]")
+            i += 1
+        elif pattern[i] == "[" and (end := pattern.find("]", i + 2)) > 0:
+            body = pattern[i + 1:end].replace("\\", "\\\\").replace("[", "\\[")
+            parts.append("[" + ("^" + body[1:] if body.startswith("!") else body) + "]")
+            i = end + 1
+        else:
+            parts.append(re.escape(pattern[i]))
+            i += 1
+    return "".join(parts)
+
+class BackupRules:
+    # gitignore-style rules: '!' re-includes, a trailing '/' only matches
+    # directories, a pattern with a '/' in it is anchored to the home
+    # directory and one without matches a name at any depth. The last
+    # matching rule wins. All rules are compiled into one regex whose
+    # alternatives run last rule first, so a single fullmatch per path
+    # decides, and the matching group's name says which way.
+    def __init__(self, patterns=BACKUP_IGNORE_DEFAULTS):
+        alternatives = []
+        for number, pattern in enumerate(patterns):
+            include = pattern.startswith("!")
+            pattern = pattern[1:] if include else pattern
+            directory = pattern.endswith("/")
+            pattern = pattern.rstrip("/")
+            anchored = "/" in pattern
+            regex = ("" if anchored else "(?:.*/)?") + _glob_regex(pattern.lstrip("/")) + ("/" if directory else "/?")
+            alternatives.append(f"(?P<{'i' if include else 'x'}{number}>{regex})")
+        self.patterns = list(patterns)
+        self.regex = re.compile("|".join(reversed(alternatives)), re.DOTALL) if alternatives else None
+
+    @classmethod
+    def load(cls, path):
+        patterns = list(BACKUP_IGNORE_DEFAULTS)
+        with open(path) as f:
+            for number, line in enumerate(f, 1):
+                line = line.rstrip("\n")
+                if not line.strip() or line.startswith("#"):
+                    continue
+                try:
+                    cls([line])
+                except re.error as e:
+                    raise ValueError(f"{path}:{number}: bad pattern {line!r}: {e}")
+                patterns.append(line)
+        return cls(patterns)
+
+    def excluded(self, rel, is_dir):
+        match = self.regex.fullmatch(rel + "/" if is_dir else rel) if self.regex else None
+        return match is not None and match.lastgroup[0] == "x"
+
+_backup_rules = None
+
+def load_backup_rules(path=BACKUP_IGNORE_FILE):
+    global _backup_rules
+    try:
+        _backup_rules = BackupRules.load(path)
+    except FileNotFoundError:
+        _backup_rules = BackupRules()
+    except ValueError as e:
+        print(f"[ERROR] Backup rules file ignored: {e}")
+        log(f"ERROR: Backup rules file ignored: {e}")
+        _backup_rules = BackupRules()
+    return _backup_rules
+
+def _report_skipped(skipped):
+    summary = (f"{skipped['files']} files ({human_size(skipped['bytes'])}) excluded, "
+               f"{skipped['directories']} directories pruned")
+    print(summary)
+    return summary
+
+def walk_home(root, rules=None, skipped=None):
+    # Depth-first in sorted name order, yielding (relative path, full path,
+    # lstat). A directory comes right before its contents, so comparing
+    # paths component by component gives the same order as the walk.
+    # Entries the rules exclude are counted in skipped; an excluded
+    # directory is never opened, so what is under it is not counted.
+    def listing(directory):
+        try:
+            with os.scandir(directory) as entries:
+                return iter(sorted(entries, key=lambda entry: entry.name))
+        except OSError as e:
+            log(f"Backup skipped {directory}: {e}")
+            return iter(())
+
+    stack = [("", listing(root))]
+    while stack:
+        prefix, entries = stack[-1]
+        entry = next(entries, None)
+        if entry is None:
+            stack.pop()
+            continue
+        try:
+            st = entry.stat(follow_symlinks=False)
+        except OSError:
+            continue
+        rel = prefix + entry.name
+        if rules is not None and rules.excluded(rel, stat.S_ISDIR(st.st_mode)):
+            if skipped is not None:
+                if stat.S_ISDIR(st.st_mode):
+                    skipped["directories"] += 1
+                else:
+                    skipped["files"] += 1
+                    skipped["bytes"] += st.st_size
+            continue
+        yield rel, entry.path, st
+        if stat.S_ISDIR(st.st_mode):
+            stack.append((rel + "/", listing(entry.path)))
+
+def _content_digest(path, kind, bucket=None):
+    if kind == "d":
+        return "-"
+    if kind == "l":
+        return hashlib.sha256(os.fsencode(os.readlink(path))).hexdigest()
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(BACKUP_HASH_BLOCK):
+            digest.update(block)
+            if bucket is not None:
+                bucket.consume(len(block))
+    return digest.hexdigest()
+
+def read_manifest(path):
+    with open(path, encoding="utf-8", errors="surrogateescape") as f:
+        for line in f:
+            kind, mode, size, mtime_ns, inode, digest, name = line.rstrip("\n").split("\t", 6)
+            yield BackupEntry(_unescape_path(name), kind, int(mode, 8), int(size), int(mtime_ns), int(inode), digest)
+
+def _manifest_line(rel, st, kind, digest):
+    return (f"{kind}\t{stat.S_IMODE(st.st_mode):o}\t{st.st_size}\t{st.st_mtime_ns}\t{st.st_ino}\t{digest}\t"
+            f"{_escape_path(rel)}\n")
+
+def _unchanged(old, st, kind):
+    return old is not None and (old.kind, old.mode, old.size, old.mtime_ns, old.inode) == \
+        (kind, stat.S_IMODE(st.st_mode), st.st_size, st.st_mtime_ns, st.st_ino)
+
+def merge_listing(previous, root, rules=None, skipped=None):
+    # Pairs every entry under root with its line in a previous manifest.
+    # Both sides are in walk order, so one pass over each finds the new,
+    # changed and deleted paths without holding either listing in memory.
+    # Yields (old entry, (rel, path, lstat, kind)), None for a missing side;
+    # a path whose kind changed comes out as a deletion and an addition.
+    old = next(previous, None)
+    for rel, path, st in walk_home(root, rules, skipped):
+        if os.path.commonpath([path, BACKUP_DIR]) == BACKUP_DIR:
+            continue
+        kind = _entry_kind(st.st_mode)
+        if kind is None:
+            continue
+        key = rel.split("/")
+        while old is not None and old.path.split("/") < key:
+            yield old, None
+            old = next(previous, None)
+        match = None
+        if old is not None and old.path == rel:
+            match, old = old, next(previous, None)
+            if match.kind != kind:
+                # A directory replaced by a file or the other way round:
+                # the old entry goes, the new one is added from scratch.
+                yield match, None
+                match = None
+        yield match, (rel, path, st, kind)
+    while old is not None:
+        yield old, None
+        old = next(previous, None)
+
+def backup_snapshots():
+    # Snapshot ids are timestamps, so name order is chain order.
+    snapshots = []
+    for name in sorted(os.listdir(BACKUP_CHAIN_DIR)) if os.path.isdir(BACKUP_CHAIN_DIR) else ():
+        match = re.fullmatch(r"(\d{8}_\d{6})-(full|incr)\.manifest", name)
+        if match:
+            snapshots.append((match.group(1), match.group(2)))
+    return snapshots
+
+def _chain_path(snapshot, level, suffix):
+    return os.path.join(BACKUP_CHAIN_DIR, f"{snapshot}-{level}.{suffix}")
+
+def backup_incremental(full=False, limit=None, progress=True):
+    print("\n--- Incremental backup of home directory ---")
+    os.makedirs(BACKUP_CHAIN_DIR, exist_ok=True)
+    home = os.path.expanduser("~")
+    snapshot = datetime.now().strftime("%Y%m%d_%H%M%S")
+    snapshots = backup_snapshots()
+    if snapshots and snapshots[-1][0] == snapshot:
+        time.sleep(1)
+        snapshot = datetime.now().strftime("%Y%m%d_%H%M%S")
+    level = "full" if full or not snapshots else "incr"
+    last = None if level == "full" else _chain_path(*snapshots[-1], "manifest")
+    previous = iter(()) if last is None else read_manifest(last)
+    archive_path = _chain_path(snapshot, level, "tar.gz")
+    manifest_path = _chain_path(snapshot, level, "manifest")
+    deleted_path = _chain_path(snapshot, level, "deleted")
+    scanned = archived = archived_bytes = deleted = 0
+    rules = _backup_rules or load_backup_rules()
+    skipped = collections.Counter()
+    bucket = TokenBucket(limit) if limit else None
+    meter = BackupProgress(*backup_estimate(home, rules, last)) if progress else BackupProgress(show=False)
+    try:
+        with ParallelGzipWriter(archive_path) as out, tarfile.open(fileobj=out, mode="w|") as archive, \
+                open(manifest_path + ".tmp", "w", encoding="utf-8", errors="surrogateescape") as manifest, \
+                open(deleted_path, "w", encoding="utf-8", errors="surrogateescape") as gone:
+            for old, current in merge_listing(previous, home, rules, skipped):
+                if current is None:
+                    gone.write(_escape_path(old.path) + "\n")
+                    deleted += 1
+                    continue
+                rel, path, st, kind = current
+                scanned += 1
+                try:
+                    digest = old.digest if _unchanged(old, st, kind) else _content_digest(path, kind, bucket)
+                except OSError as e:
+                    log(f"Backup skipped {path}: {e}")
+                    digest = None
+                changed = digest is not None and \
+                    (old is None or (old.kind, old.mode, old.digest) != (kind, stat.S_IMODE(st.st_mode), digest))
+                if changed and not _add_to_archive(archive, path, bucket, rel):
+                    digest = None
+                if kind == "f":
+                    meter.update(1, st.st_size)
+                if digest is None:
+                    continue
+                if changed:
+                    archived += 1
+                    archived_bytes += st.st_size if kind == "f" else 0
+                manifest.write(_manifest_line(rel, st, kind, digest))
+        meter.finish()
+    except (OSError, tarfile.TarError) as e:
+        for leftover in (archive_path, manifest_path + ".tmp", deleted_path):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        error_exit(f"Backup failed: {e}")
+    # The manifest is the commit point: the next run diffs against it only
+    # once the archive it describes is complete.
+    os.replace(manifest_path + ".tmp", manifest_path)
+    print(f"{level} snapshot {snapshot}: {scanned} entries scanned, {archived} archived "
+          f"({human_size(archived_bytes)}), {deleted} deleted")
+    summary = _report_skipped(skipped)
+    print(f"Backup saved to {archive_path}")
+    log(f"Backup created: {archive_path} ({archived} archived, {deleted} deleted, {summary})")
+
+def restore_backup(target, snapshot=None):
+    print("\n--- Restoring home directory backup ---")
+    snapshots = [entry for entry in backup_snapshots() if snapshot is None or entry[0] <= snapshot]
+    if not snapshots:
+        error_exit("No incremental backups to restore")
+    bases = [i for i, (_, level) in enumerate(snapshots) if level == "full"]
+    if not bases:
+        error_exit("No full backup found before the requested snapshot")
+    target = os.path.abspath(target)
+    os.makedirs(target, exist_ok=True)
+    extract = {"filter": "tar"} if hasattr(tarfile, "tar_filter") else {}
+    try:
+        for snapshot_id, level in snapshots[bases[-1]:]:
+            # Deletions first: a path that changed kind is in both the
+            # deletion list and the archive of the same snapshot.
+            with open(_chain_path(snapshot_id, level, "deleted"), encoding="utf-8", errors="surrogateescape") as gone:
+                for line in gone:
+                    path = os.path.normpath(os.path.join(target, _unescape_path(line.rstrip("\n"))))
+                    if os.path.commonpath([path, target]) != target or path == target:
+                        continue
+                    if os.path.isdir(path) and not os.path.islink(path):
+                        shutil.rmtree(path, ignore_errors=True)
+                    elif os.path.lexists(path):
+                        os.remove(path)
+            with tarfile.open(_chain_path(snapshot_id, level, "tar.gz")) as archive:
+                archive.extractall(target, **extract)
+            print(f"Applied {level} snapshot {snapshot_id}")
+    except (OSError, tarfile.TarError) as e:
+        error_exit(f"Restore failed: {e}")
+    print(f"Restored {snapshots[-1][0]} into {target}")
+    log(f"Backup restored: {snapshots[-1][0]} -> {target}")
+
+# Per-byte values for the rolling hash. They are derived rather than random
+# so cut points, and with them deduplication, stay stable between versions.
+# Values with equal nibbles are left out because a run of one hashes to zero.
+GEAR_TABLE = bytes(next(b for b in hashlib.sha256(b"gear%d" % i).digest() if b >> 4 != b & 15) for i in range(256))
+
+def rolling_hash(data):
+    # Byte i of the result is a shift-xor hash over the gear values of the
+    # bytes ending at i (under BACKUP_CDC_WINDOW of them). Treating the whole
+    # buffer as one integer turns each step into a single C-level pass
+    # instead of a Python loop per byte.
+    x = int.from_bytes(data.translate(GEAR_TABLE), "big")
+    for shift in (7, 13, 29, 53):
+        x ^= x >> shift
+    return x.to_bytes(len(data), "big")
+
+def cut_point(data):
+    # Length of the first chunk in data: just past the first two zero hash
+    # bytes at least BACKUP_CDC_MIN in, else BACKUP_CDC_MAX. The minimum is
+    # never hashed, which skips most of every chunk.
+    limit = min(len(data), BACKUP_CDC_MAX)
+    start = BACKUP_CDC_MIN
+    while start < limit:
+        stop = min(start + BACKUP_CDC_STEP, limit)
+        found = rolling_hash(data[start - BACKUP_CDC_WINDOW:stop]).find(b"\0\0", BACKUP_CDC_WINDOW)
+        if found >= 0:
+            return start - BACKUP_CDC_WINDOW + found + 2
+        if stop == limit:
+            break
+        start = stop - 1
+    return limit
+
+def iter_chunks(f):
+    # The buffer is refilled before every cut, since a chunk can take all
+    # of it when there is no cut point within BACKUP_CDC_MAX.
+    buffer = b""
+    while True:
+        while len(buffer) < BACKUP_CDC_MAX and (block := f.read(BACKUP_CDC_MAX - len(buffer))):
+            buffer += block
+        if not buffer:
+            return
+        end = cut_point(buffer)
+        yield buffer[:end]
+        buffer = buffer[end:]
+
+def _chunk_path(repo, digest):
+    return os.path.join(repo, "chunks", digest[:2], digest)
+
+def _store_chunk(repo, data):
+    digest = hashlib.sha256(data).hexdigest()
+    path = _chunk_path(repo, digest)
+    if os.path.exists(path):
+        return digest, 0
+    packed = zlib.compress(data, BACKUP_COMPRESS_LEVEL)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial = f"{path}.{os.getpid()}.tmp"
+    with open(partial, "wb") as f:
+        f.write(packed)
+    os.replace(partial, path)
+    return digest, len(packed)
+
+def _load_chunk(repo, digest):
+    with open(_chunk_path(repo, digest), "rb") as f:
+        data = zlib.decompress(f.read())
+    if hashlib.sha256(data).hexdigest() != digest:
+        raise ValueError(f"chunk {digest} is corrupt")
+    return data
+
+def _file_chunks(path, kind):
+    if kind == "l":
+        yield os.fsencode(os.readlink(path))
+        return
+    with open(path, "rb") as f:
+        yield from iter_chunks(f)
+
+def _store_files(repo, items):
+    # Runs on the backup pool. Chunks and stores each (path, kind) and
+    # returns (comma separated chunk digests, bytes written) per item, or
+    # (None, error) for one that could not be read.
+    results = []
+    for path, kind in items:
+        digests, stored = [], 0
+        try:
+            for chunk in _file_chunks(path, kind):
+                digest, written = _store_chunk(repo, chunk)
+                digests.append(digest)
+                stored += written
+        except OSError as e:
+            results.append((None, str(e)))
+            continue
+        results.append((",".join(digests) or "-", stored))
+    return results
+
+def repository_snapshots():
+    directory = os.path.join(BACKUP_REPO_DIR, "snapshots")
+    names = sorted(os.listdir(directory)) if os.path.isdir(directory) else ()
+    return [name[:-len(".manifest")] for name in names if re.fullmatch(r"\d{8}_\d{6}\.manifest", name)]
+
+def _snapshot_path(snapshot):
+    return os.path.join(BACKUP_REPO_DIR, "snapshots", f"{snapshot}.manifest")
+
+def _repository_batches(previous, root, rules, skipped):
+    # Groups the walk into batches of about BACKUP_BATCH_BYTES of changed
+    # data, so small files do not each cost a round trip to the pool.
+    # Entries whose chunks are already known carry them along.
+    batch, work = [], 0
+    for old, current in merge_listing(previous, root, rules, skipped):
+        if current is None:
+            continue
+        rel, path, st, kind = current
+        known = "-" if kind == "d" else old.digest if _unchanged(old, st, kind) else None
+        batch.append((rel, path, st, kind, known))
+        if known is None:
+            work += st.st_size
+        if work >= BACKUP_BATCH_BYTES or len(batch) >= BACKUP_BATCH_FILES:
+            yield batch
+            batch, work = [], 0
+    if batch:
+        yield batch
+
+def _write_batch(manifest, batch, future, meter):
+    results = iter(future.result() if future else ())
+    stored = 0
+    for rel, path, st, kind, digests in batch:
+        if kind == "f":
+            meter.update(1, st.st_size)
+        if digests is None:
+            digests, written = next(results)
+            if digests is None:
+                log(f"Backup skipped {path}: {written}")
+                continue
+            stored += written
+        manifest.write(_manifest_line(rel, st, kind, digests))
+    return stored
+
+def backup_repository(limit=None, progress=True):
+    print("\n--- Deduplicated backup of home directory ---")
+    os.makedirs(os.path.join(BACKUP_REPO_DIR, "snapshots"), exist_ok=True)
+    home = os.path.expanduser("~")
+    snapshots = repository_snapshots()
+    snapshot = datetime.now().strftime("%Y%m%d_%H%M%S")
+    if snapshots and snapshots[-1] == snapshot:
+        time.sleep(1)
+        snapshot = datetime.now().strftime("%Y%m%d_%H%M%S")
+    last = _snapshot_path(snapshots[-1]) if snapshots else None
+    previous = iter(()) if last is None else read_manifest(last)
+    manifest_path = _snapshot_path(snapshot)
+    scanned = total_bytes = stored_bytes = 0
+    rules = _backup_rules or load_backup_rules()
+    skipped = collections.Counter()
+    bucket = TokenBucket(limit) if limit else None
+    meter = BackupProgress(*backup_estimate(home, rules, last)) if progress else BackupProgress(show=False)
+    try:
+        # Batches are stored in parallel but their manifest lines are
+        # written in submission order, keeping the manifest in walk order.
+        with concurrent.futures.ProcessPoolExecutor(max_workers=BACKUP_WORKERS) as pool, \
+                open(manifest_path + ".tmp", "w", encoding="utf-8", errors="surrogateescape") as manifest:
+            pending = collections.deque()
+            for batch in _repository_batches(previous, home, rules, skipped):
+                scanned += len(batch)
+                total_bytes += sum(st.st_size for _, _, st, kind, _ in batch if kind == "f")
+                items = [(path, kind) for _, path, _, kind, known in batch if known is None]
+                if bucket is not None:
+                    # The workers do the reading, so the limit is applied
+                    # here by holding back each batch until it fits.
+                    bucket.consume(sum(st.st_size for _, _, st, _, known in batch if known is None))
+                pending.append((batch, pool.submit(_store_files, BACKUP_REPO_DIR, items) if items else None))
+                if len(pending) > 2 * BACKUP_WORKERS:
+                    stored_bytes += _write_batch(manifest, *pending.popleft(), meter)
+            while pending:
+                stored_bytes += _write_batch(manifest, *pending.popleft(), meter)
+        meter.finish()
+    except OSError as e:
+        if os.path.exists(manifest_path + ".tmp"):
+            os.remove(manifest_path + ".tmp")
+        error_exit(f"Backup failed: {e}")
+    # Chunks are written before the manifest that references them, so an
+    # interrupted run leaves at most some unreferenced chunks behind.
+    os.replace(manifest_path + ".tmp", manifest_path)
+    print(f"snapshot {snapshot}: {scanned} entries, {human_size(total_bytes)} of files, "
+          f"{human_size(stored_bytes)} of new chunks stored")
+    summary = _report_skipped(skipped)
+    print(f"Backup saved to {manifest_path}")
+    log(f"Backup created: {manifest_path} ({human_size(stored_bytes)} new, {summary})")
+
+def restore_repository(target, snapshot=None):
+    print("\n--- Restoring home directory from repository ---")
+    snapshots = [entry for entry in repository_snapshots() if snapshot is None or entry <= snapshot]
+    if not snapshots:
+        error_exit("No repository snapshots to restore")
+    target = os.path.abspath(target)
+    os.makedirs(target, exist_ok=True)
+    directories = []
+    try:
+        for entry in read_manifest(_snapshot_path(snapshots[-1])):
+            path = os.path.normpath(os.path.join(target, entry.path))
+            if os.path.commonpath([path, target]) != target or path == target:
+                continue
+            if entry.kind == "d":
+                os.makedirs(path, exist_ok=True)
+                directories.append((path, entry))
+                continue
+            if os.path.lexists(path):
+                os.remove(path)
+            if entry.kind == "l":
+                os.symlink(os.fsdecode(_load_chunk(BACKUP_REPO_DIR, entry.digest)), path)
+                continue
+            with open(path, "wb") as f:
+                for digest in entry.digest.split(","):
+                    if digest != "-":
+                        f.write(_load_chunk(BACKUP_REPO_DIR, digest))
+            os.chmod(path, entry.mode)
+            os.utime(path, ns=(entry.mtime_ns, entry.mtime_ns))
+        # Directories last, so read-only ones could still be filled and
+        # their mtimes are not bumped by the files restored into them.
+        for path, entry in reversed(directories):
+            os.chmod(path, entry.mode)
+            os.utime(path, ns=(entry.mtime_ns, entry.mtime_ns))
+    except (OSError, ValueError) as e:
+        error_exit(f"Restore failed: {e}")
+    print(f"Restored {snapshots[-1]} into {target}")
+    log(f"Backup restored: {snapshots[-1]} -> {target}")
+
+def read_passwd():
+    users = []
     with open("/etc/passwd") as f:
         for line in f:
             parts = line.strip().split(":")
-            if len(parts) > 2 and parts[2].isdigit() and int(parts[2]) >= 1000 and parts[0] != "nobody":
-                print(parts[0])
+            if len(parts) > 2 and parts[2].isdigit():
+                users.append((parts[0], int(parts[2])))
+    return users
+
+def _regular_user(name, uid):
+    return uid >= 1000 and name != "nobody"
+
+def list_users():
+    print("\n--- User Listing ---")
+    for name, uid in read_passwd():
+        if _regular_user(name, uid):
+            print(name)
+
+class UserUsage:
+    # Accumulates per-UID totals in parallel arrays indexed by a slot per UID,
+    # so a pass over thousands of processes creates no per-process objects.
+    def __init__(self, capacity=64):
+        self.slots = {}
+        self.uids = []
+        self.rss = array("Q", bytes(8 * capacity))
+        self.cpu = array("d", bytes(8 * capacity))
+        self.procs = array("Q", bytes(8 * capacity))
+        self.fds = array("Q", bytes(8 * capacity))
+        self.hidden_fds = array("Q", bytes(8 * capacity))
+
+    def _slot(self, uid):
+        slot = self.slots.get(uid)
+        if slot is None:
+            slot = self.slots[uid] = len(self.uids)
+            self.uids.append(uid)
+            if slot == len(self.rss):
+                for column in (self.rss, self.cpu, self.procs, self.fds, self.hidden_fds):
+                    column.extend(array(column.typecode, bytes(column.itemsize * slot)))
+        return slot
+
+    def scan(self):
+        for name in os.listdir("/proc"):
+            if not name.isdigit():
+                continue
+            try:
+                uid = os.stat(f"/proc/{name}").st_uid
+                _, fields = read_proc_stat(name)
+            except (OSError, ValueError):
+                continue
+            slot = self._slot(uid)
+            self.rss[slot] += int(fields[21]) * PAGE_SIZE
+            self.cpu[slot] += (int(fields[11]) + int(fields[12])) / CLK_TCK
+            self.procs[slot] += 1
+            try:
+                self.fds[slot] += len(os.listdir(f"/proc/{name}/fd"))
+            except PermissionError:
+                self.hidden_fds[slot] += 1
+            except OSError:
+                pass
+        return self
+
+def collect_user_usage():
+    usage = UserUsage().scan()
+    rows = []
+    seen = set()
+    for name, uid in read_passwd():
+        if uid in seen:
+            continue
+        seen.add(uid)
+        slot = usage.slots.get(uid)
+        if slot is None and not _regular_user(name, uid):
+            continue
+        rows.append((name, uid, slot))
+    rows.extend((str(uid), uid, slot) for uid, slot in usage.slots.items() if uid not in seen)
+    report = []
+    for name, uid, slot in rows:
+        if slot is None:
+            report.append({"user": name, "uid": uid, "procs": 0, "rss": 0, "cpu_seconds": 0.0, "fds": 0, "hidden_fds": 0})
+        else:
+            report.append({"user": name, "uid": uid, "procs": usage.procs[slot], "rss": usage.rss[slot],
+                           "cpu_seconds": usage.cpu[slot], "fds": usage.fds[slot],
+                           "hidden_fds": usage.hidden_fds[slot]})
+    report.sort(key=lambda row: (row["rss"], row["cpu_seconds"]), reverse=True)
+    return report
+
+def user_resources():
+    print("\n--- Resource Usage by User ---")
+    print(f"{'USER':<16}{'UID':>7}{'PROCS':>7}{'RSS':>9}{'CPU TIME':>12}{'FDS':>8}")
+    for row in collect_user_usage():
+        cpu = int(row["cpu_seconds"])
+        fds = f"{row['fds']}{'+' if row['hidden_fds'] else ''}"
+        print(f"{row['user'][:16]:<16}{row['uid']:>7}{row['procs']:>7}{human_size(row['rss']):>9}"
+              f"{cpu // 3600:>6}:{cpu // 60 % 60:02d}:{cpu % 60:02d}{fds:>8}")
 
 def create_user():
     username = input("Enter username to create: ").strip()
@@ -72,6 +2764,98 @@ def ping_test():
     except Exception:
         error_exit("Ping failed.")
 
+TCP_STATES = {
+    "01": "ESTABLISHED", "02": "SYN_SENT", "03": "SYN_RECV", "04": "FIN_WAIT1", "05": "FIN_WAIT2",
+    "06": "TIME_WAIT", "07": "CLOSE", "08": "CLOSE_WAIT", "09": "LAST_ACK", "0A": "LISTEN", "0B": "CLOSING",
+}
+SOCKET_TABLES = (("tcp", socket.AF_INET), ("tcp6", socket.AF_INET6), ("udp", socket.AF_INET), ("udp6", socket.AF_INET6))
+
+def _decode_address(value, family):
+    # /proc/net prints each 32-bit word of the address in host byte order.
+    host, port = value.split(":")
+    raw = bytes.fromhex(host)
+    if sys.byteorder == "little":
+        raw = b"".join(raw[i:i + 4][::-1] for i in range(0, len(raw), 4))
+    return socket.inet_ntop(family, raw), int(port, 16)
+
+def socket_owners():
+    # One sweep of /proc/*/fd builds the inode -> (pid, comm) index for this refresh.
+    owners = {}
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            fds = os.listdir(f"/proc/{name}/fd")
+        except OSError:
+            continue
+        comm = None
+        for fd in fds:
+            try:
+                target = os.readlink(f"/proc/{name}/fd/{fd}")
+            except OSError:
+                continue
+            if target.startswith("socket:["):
+                if comm is None:
+                    try:
+                        with open(f"/proc/{name}/comm") as f:
+                            comm = f.read().strip()
+                    except OSError:
+                        comm = "?"
+                owners.setdefault(int(target[8:-1]), (int(name), comm))
+    return owners
+
+def read_sockets():
+    sockets = []
+    for table, family in SOCKET_TABLES:
+        try:
+            with open(f"/proc/net/{table}") as f:
+                lines = f.readlines()[1:]
+        except FileNotFoundError:
+            continue
+        for line in lines:
+            fields = line.split()
+            if len(fields) < 10:
+                continue
+            local, remote = _decode_address(fields[1], family), _decode_address(fields[2], family)
+            if table.startswith("tcp"):
+                state = TCP_STATES.get(fields[3], fields[3])
+            else:
+                state = "UNCONN" if fields[3] == "07" else "ESTABLISHED"
+            sockets.append({"proto": table, "local": local, "remote": remote, "state": state, "inode": int(fields[9])})
+    return sockets
+
+def _endpoint(address):
+    host, port = address
+    return f"[{host}]:{port}" if ":" in host else f"{host}:{port}"
+
+def show_connections(listening_only=False):
+    print("\n--- Network Connections ---")
+    sockets = read_sockets()
+    owners = socket_owners()
+    listening = [sock for sock in sockets if sock["state"] in ("LISTEN", "UNCONN")]
+    print("Listening:")
+    print(f"{'PROTO':<7}{'LOCAL ADDRESS':<42}PROCESS")
+    for sock in sorted(listening, key=lambda sock: (sock["local"][1], sock["proto"])):
+        pid, comm = owners.get(sock["inode"], (None, None))
+        print(f"{sock['proto']:<7}{_endpoint(sock['local']):<42}{f'{comm}/{pid}' if pid else '-'}")
+    if listening_only:
+        return
+    connected = [sock for sock in sockets if sock["state"] not in ("LISTEN", "UNCONN")]
+    print("Connections:")
+    print(f"{'PROTO':<7}{'LOCAL ADDRESS':<42}{'REMOTE ADDRESS':<42}{'STATE':<13}PROCESS")
+    for sock in connected:
+        pid, comm = owners.get(sock["inode"], (None, None))
+        print(f"{sock['proto']:<7}{_endpoint(sock['local']):<42}{_endpoint(sock['remote']):<42}"
+              f"{sock['state']:<13}{f'{comm}/{pid}' if pid else '-'}")
+    listening_ports = {sock["local"][1] for sock in listening}
+    per_port = collections.defaultdict(collections.Counter)
+    for sock in connected:
+        port = sock["local"][1] if sock["local"][1] in listening_ports else sock["remote"][1]
+        per_port[port][sock["state"]] += 1
+    print("States per port:")
+    for port, states in sorted(per_port.items()):
+        print(f"{port:>7}  " + ", ".join(f"{state} {count}" for state, count in states.most_common()))
+
 def fetch_url():
     import requests
     url = input("Enter URL to fetch: ").strip()
@@ -84,8 +2868,7 @@ def fetch_url():
 def run_background_task():
     def task():
         time.sleep(30)
-        with open(LOGFILE, "a") as f:
-            f.write(f"{datetime.now()} : Background task complete!\n")
+        log("Background task complete!")
         print("Background task complete!")
 
     print("Running background task (30 seconds)...")
@@ -94,14 +2877,239 @@ def run_background_task():
     thread.start()
     print(f"Background task started with thread ID: {thread.ident}")
 
-def show_logs():
+def show_logs(lines=LOG_TAIL_LINES, since=None, until=None, follow=False):
     print("\n--- Logs ---")
-    if os.path.exists(LOGFILE):
-        with open(LOGFILE, "r") as f:
-            lines = f.readlines()
-            print("".join(lines[-50:]))
-    else:
+    flush_log()
+    if follow:
+        try:
+            follow_log(lines)
+        except KeyboardInterrupt:
+            print()
+        return
+    if not log_segments():
         print("No logs found.")
+        return
+    if since or until:
+        for line in iter_log_range(since, until):
+            sys.stdout.write(line)
+        return
+    print("".join(tail_log(lines)))
+
+def bench_log(records=100000):
+    print("\n--- Log Writer Benchmark ---")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "open_per_call.log")
+        start = time.perf_counter()
+        for i in range(records):
+            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            with open(path, "a") as f:
+                f.write(f"{timestamp} : record {i}\n")
+        legacy = records / (time.perf_counter() - start)
+
+        writer = LogWriter(os.path.join(tmp, "batched.log"))
+        start = time.perf_counter()
+        for i in range(records):
+            writer.write(f"{_timestamp()} : record {i}\n")
+        writer.close()
+        batched = records / (time.perf_counter() - start)
+    print(f"open-per-call:  {legacy:,.0f} records/sec")
+    print(f"batched writer: {batched:,.0f} records/sec ({batched / legacy:.1f}x)")
+
+def bench_monitor(iterations=20):
+    print("\n--- System Monitoring Benchmark ---")
+    commands = ["uptime -p", "who", "free -h", "df -h", "ps aux --sort=-%mem | head -n 10"]
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for command in commands:
+            subprocess.getoutput(command)
+    forked = (time.perf_counter() - start) / iterations
+    start = time.perf_counter()
+    for _ in range(iterations):
+        collect_system()
+    native = (time.perf_counter() - start) / iterations
+    print(f"subprocess commands: {forked * 1000:.1f} ms/call")
+    print(f"/proc collectors:    {native * 1000:.1f} ms/call ({forked / native:.1f}x)")
+
+def bench_alerts(rules=500):
+    print("\n--- Alert Evaluation Benchmark ---")
+    sample = collect_sample()
+    metrics = sorted(sample)
+    engine = AlertEngine(AlertRule(f"{metrics[i % len(metrics)]} > {i} for 60s") for i in range(rules))
+    iterations = 1000
+    start = time.perf_counter()
+    for i in range(iterations):
+        for rule in engine.rules:
+            value = sample.get(rule.metric)
+            if value is not None:
+                rule.evaluate(value, i)
+    elapsed = (time.perf_counter() - start) / iterations
+    print(f"{rules} rules: {elapsed * 1e6:.0f} us per sample ({elapsed * 1e6 / rules:.2f} us per rule)")
+
+def bench_ptree(processes=50000):
+    print("\n--- Process Tree Benchmark ---")
+    entries = {pid: {"ppid": max(1, pid // 4), "rss": pid, "cpu_pct": 0.0} for pid in range(1, processes + 1)}
+    start = time.perf_counter()
+    build_process_tree(entries)
+    built = time.perf_counter() - start
+    start = time.perf_counter()
+    scanned = len(ProcessTable().scan())
+    scan = time.perf_counter() - start
+    print(f"build over {processes} synthetic processes: {built * 1000:.0f} ms")
+    print(f"/proc scan of {scanned} live processes:   {scan * 1000:.0f} ms")
+
+def bench_compress(megabytes=256):
+    print("\n--- Compression Benchmark ---")
+    line = b"".join(b"%08d %s\n" % (i, os.urandom(24).hex().encode()) for i in range(4096))
+    data = (line * (megabytes * 1024 * 1024 // len(line) + 1))[:megabytes * 1024 * 1024]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.gz")
+        start = time.perf_counter()
+        with open(path, "wb") as f:
+            f.write(gzip.compress(data, compresslevel=BACKUP_COMPRESS_LEVEL))
+        single = time.perf_counter() - start
+        start = time.perf_counter()
+        with ParallelGzipWriter(path) as out:
+            for offset in range(0, len(data), 64 * 1024):
+                out.write(data[offset:offset + 64 * 1024])
+        parallel = time.perf_counter() - start
+        with gzip.open(path) as f:
+            if f.read() != data:
+                raise ValueError("parallel gzip output does not decompress to the input")
+    print(f"single gzip:           {megabytes / single:8.1f} MB/s")
+    print(f"{BACKUP_WORKERS} worker parallel gzip: {megabytes / parallel:8.1f} MB/s ({single / parallel:.1f}x)")
+
+def bench_chunk(megabytes=64):
+    print("\n--- Chunking Benchmark ---")
+    data = os.urandom(megabytes * 1024 * 1024)
+    start = time.perf_counter()
+    chunks = list(iter_chunks(io.BytesIO(data)))
+    chunked = time.perf_counter() - start
+    start = time.perf_counter()
+    for chunk in chunks:
+        hashlib.sha256(chunk).digest()
+    hashed = time.perf_counter() - start
+    shifted = list(iter_chunks(io.BytesIO(b"inserted" + data)))
+    shared = len(set(chunks) & set(shifted))
+    # Zero-filled and sparse data has no cut points at all.
+    sparse = bytes(2 * BACKUP_CDC_MAX) + data[:BACKUP_CDC_MAX] + bytes(BACKUP_CDC_MAX + 12345)
+    if b"".join(iter_chunks(io.BytesIO(sparse))) != sparse or b"".join(chunks) != data:
+        raise ValueError("chunking lost data")
+    print(f"content-defined chunking: {megabytes / chunked:8.1f} MB/s, {len(chunks)} chunks, "
+          f"mean {human_size(len(data) // len(chunks))}")
+    print(f"sha256 of the chunks:     {megabytes / hashed:8.1f} MB/s")
+    print(f"after an 8 byte insert at the start {shared} of {len(chunks)} chunks are unchanged")
+
+BENCHMARKS = {
+    "alerts": bench_alerts,
+    "chunk": bench_chunk,
+    "compress": bench_compress,
+    "log": bench_log,
+    "monitor": bench_monitor,
+    "ptree": bench_ptree,
+}
+
+def run_command(argv):
+    parser = argparse.ArgumentParser(description="Mega Python Toolkit")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    logs = commands.add_parser("logs", help="show the toolkit log")
+    logs.add_argument("-n", "--lines", type=int, default=LOG_TAIL_LINES, help="number of lines to show")
+    logs.add_argument("--since", type=parse_log_time, help="show lines from this time (e.g. '2024-05-01 12:00' or 1h)")
+    logs.add_argument("--until", type=parse_log_time, help="show lines up to this time")
+    logs.add_argument("-f", "--follow", action="store_true", help="stream new lines as they are written")
+
+    monitor = commands.add_parser("monitor", help="show a system snapshot or watch it over time")
+    monitor.add_argument("-w", "--watch", action="store_true", help="sample continuously until interrupted")
+    monitor.add_argument("-i", "--interval", type=float, default=WATCH_INTERVAL, help="seconds between samples")
+    monitor.add_argument("-s", "--samples", type=int, default=WATCH_SAMPLES, help="samples kept per metric")
+    monitor.add_argument("-c", "--count", type=int, help="stop after this many samples")
+    monitor.add_argument("--rules", help=f"alert rules file (default {ALERT_RULES_FILE})")
+    monitor.add_argument("--sort", choices=["rss", "cpu_pct"], default="rss", help="order of the top processes")
+
+    export = commands.add_parser("export", help="serve monitor metrics in Prometheus text format")
+    export.add_argument("--bind", default=EXPORTER_BIND, help="address to listen on")
+    export.add_argument("--port", type=int, default=EXPORTER_PORT, help="port to listen on")
+    export.add_argument("--ttl", type=float, default=EXPORTER_TTL, help="seconds a collected snapshot is reused")
+
+    history = commands.add_parser("history", help="show persisted monitor samples")
+    history.add_argument("--since", type=parse_log_time, help="first sample time (e.g. '2024-05-01 12:00' or 2h)")
+    history.add_argument("--until", type=parse_log_time, help="last sample time")
+
+    sessions = commands.add_parser("sessions", help="show logged in sessions from utmp")
+    sessions.add_argument("--history", action="store_true", help="show past logins from wtmp")
+    sessions.add_argument("-n", "--limit", type=int, help="only show the most recent logins")
+
+    backup = commands.add_parser("backup", help="back up the home directory")
+    backup.add_argument("--incremental", action="store_true", help="only archive files changed since the last snapshot")
+    backup.add_argument("--full", action="store_true", help="start a new incremental chain with a full snapshot")
+    backup.add_argument("--repo", action="store_true", help="store a deduplicated snapshot in the chunk repository")
+    backup.add_argument("--rules", help=f"exclusion rules file (default {BACKUP_IGNORE_FILE})")
+    backup.add_argument("--limit", type=parse_rate, help="cap the read rate, e.g. 20M for 20 MiB/s")
+    backup.add_argument("--idle", action="store_true", help="run at idle CPU and I/O priority")
+    backup.add_argument("-q", "--quiet", action="store_true", help="skip the size estimate and progress line")
+
+    restore = commands.add_parser("restore", help="rebuild the home directory from incremental snapshots")
+    restore.add_argument("--target", required=True, help="directory to restore into")
+    restore.add_argument("--snapshot", help="restore the state as of this snapshot id (default: latest)")
+    restore.add_argument("--repo", action="store_true", help="restore from the chunk repository")
+
+    commands.add_parser("users", help="show resource usage per user")
+
+    net = commands.add_parser("net", help="show listening sockets and connections")
+    net.add_argument("-l", "--listening", action="store_true", help="only show listening sockets")
+
+    ptree = commands.add_parser("ptree", help="show the process tree with subtree totals")
+    ptree.add_argument("--pid", type=int, help="only show the subtree rooted at this PID")
+    ptree.add_argument("--depth", type=int, help="limit how many levels are printed")
+
+    bench = commands.add_parser("bench", help="run a micro-benchmark")
+    bench.add_argument("target", choices=sorted(BENCHMARKS))
+    bench.add_argument("-n", "--count", type=int, help="records/iterations to run")
+
+    args = parser.parse_args(argv)
+    if args.command == "logs":
+        show_logs(args.lines, args.since, args.until, args.follow)
+    elif args.command == "monitor":
+        if args.rules:
+            load_alert_rules(args.rules)
+        if args.watch:
+            watch_system(args.interval, args.samples, args.count)
+        else:
+            monitor_system(args.sort)
+    elif args.command == "export":
+        serve_metrics(args.bind, args.port, args.ttl)
+    elif args.command == "history":
+        show_history(args.since, args.until)
+    elif args.command == "sessions":
+        show_sessions(args.history, args.limit)
+    elif args.command == "backup":
+        if args.rules:
+            load_backup_rules(args.rules)
+        if args.idle:
+            set_idle_priority()
+        if args.repo:
+            backup_repository(args.limit, not args.quiet)
+        elif args.incremental or args.full:
+            backup_incremental(args.full, args.limit, not args.quiet)
+        else:
+            backup_home(args.limit, not args.quiet)
+    elif args.command == "restore":
+        if args.repo:
+            restore_repository(args.target, args.snapshot)
+        else:
+            restore_backup(args.target, args.snapshot)
+    elif args.command == "users":
+        user_resources()
+    elif args.command == "net":
+        show_connections(args.listening)
+    elif args.command == "ptree":
+        show_process_tree(args.pid, args.depth)
+    elif args.command == "bench":
+        if args.count is None:
+            BENCHMARKS[args.target]()
+        else:
+            BENCHMARKS[args.target](args.count)
+    return 0
 
 def show_menu():
     options = {
@@ -113,14 +3121,22 @@ def show_menu():
         "6": ("Fetch URL", fetch_url),
         "7": ("Run Background Task", run_background_task),
         "8": ("View Logs", show_logs),
-        "9": ("Exit", lambda: sys.exit(0))
+        "9": ("Exit", lambda: sys.exit(0)),
+        "10": ("Watch System", watch_system),
+        "11": ("User Resources", user_resources),
+        "12": ("Process Tree", show_process_tree),
+        "13": ("Network Connections", show_connections)
     }
 
     while True:
         print("\n=== Mega Python Toolkit Menu ===")
-        for key, (desc, _) in sorted(options.items()):
+        for key, (desc, _) in sorted(options.items(), key=lambda item: int(item[0])):
             print(f"{key}) {desc}")
-        choice = input("Choose an option: ").strip()
+        try:
+            choice = input("Choose an option: ").strip()
+        except EOFError:
+            print()
+            return
         if choice in options:
             try:
                 options[choice][1]()
@@ -131,6 +3147,11 @@ def show_menu():
             print("Invalid choice.")
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        try:
+            sys.exit(run_command(sys.argv[1:]))
+        finally:
+            close_log()
     print("Starting Mega Python Toolkit...")
     log("Script started")
     try:
@@ -139,6 +3160,7 @@ if __name__ == "__main__":
         print("\nInterrupted. Exiting...")
     finally:
         log("Script exited")
+        close_log()
 #!/usr/bin/env python3
 
 import os